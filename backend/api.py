@@ -1,14 +1,58 @@
-from flask import Flask, request, jsonify
+import time
+from flask import Flask, request, jsonify, g
 from flask_cors import CORS
 from pathlib import Path
+import os
 import json
-from search_lib import search_top_k
+import threading
+from search_lib import EngineCache
+from query_cache import QueryEmbeddingCache
+from metrics import REGISTRY, SlowRequestProfiler, server_timing
 
 app = Flask(__name__)
 CORS(app)
 
 AUTH_PATH = Path("auth.json")
 AUTH_MAP = json.loads(AUTH_PATH.read_text(encoding="utf-8"))
+MAX_BATCH_QUERIES = int(os.environ.get("MAX_BATCH_QUERIES", "64"))  # queries per /api/search/batch request
+BUILD_METRICS_FILE = Path("data") / "metrics" / "build_db.prom"  # written by build_db after every pass
+
+# warm per-course search engines and cached query embeddings, kept across requests
+query_cache = QueryEmbeddingCache()
+engines = EngineCache(query_cache=query_cache, background_reload=True,
+                      backends={nid: creds.get("vector_backend") for nid, creds in AUTH_MAP.items()})
+
+# request metrics, plus cache and index gauges read when /api/metrics is scraped
+REQUEST_SECONDS = REGISTRY.histogram(
+    "piazzaplus_request_seconds", "API request latency by endpoint and status.", ("endpoint", "status"))
+REGISTRY.gauge("piazzaplus_query_cache", "Query embedding cache counters and hit rate.",
+               query_cache.stats, ("stat",))
+REGISTRY.gauge("piazzaplus_engine_bytes", "Estimated bytes of each warm course's indexes.",
+               engines.sizes, ("course", "index"))
+profiler = SlowRequestProfiler()  # off unless PROFILE_SLOW_MS is set
+
+# set once warm_up() has built every registered course (serve.py runs it at startup)
+warmed = threading.Event()
+course_status = {}
+
+
+def warm_up():
+    course_status.update(engines.warm(AUTH_MAP))
+    warmed.set()
+
+@app.before_request
+def start_request():
+    g.start = time.perf_counter()
+    g.profile = profiler.start()
+
+@app.after_request
+def finish_request(response):
+    endpoint = request.endpoint or "unknown"
+    REQUEST_SECONDS.observe(time.perf_counter() - g.start, endpoint=endpoint, status=response.status_code)
+    path = profiler.stop(g.profile, endpoint)
+    if path is not None:
+        print(f"Slow request to {request.path} profiled in {path}")
+    return response
 
 @app.get("/api/is-registered")
 def is_registered():
@@ -26,8 +70,43 @@ def search():
         return jsonify({"error": "unregistered course"}), 404
 
     try:
-        results = search_top_k(nid, query, k)
-        return jsonify({"results": results})
+        start = time.perf_counter()
+        engine = engines.get(nid)
+        timings = {"engine": time.perf_counter() - start}
+        results = engine.search(query, k, timings)
+        timings["total"] = time.perf_counter() - start
+        response = jsonify({"results": results})
+        response.headers["Server-Timing"] = server_timing(timings)
+        return response
+    except FileNotFoundError as e:
+        return jsonify({"error": str(e)}), 404
+    except Exception as e:
+        return jsonify({"error": repr(e)}), 500
+
+@app.post("/api/search/batch")
+def search_batch():
+    payload = request.get_json(force=True) or {}
+    nid = (payload.get("network_id") or "").strip()
+    queries = payload.get("queries") or []
+    k = int(payload.get("k", 10))
+
+    if nid not in AUTH_MAP:
+        return jsonify({"error": "unregistered course"}), 404
+    if not isinstance(queries, list) or not all(isinstance(q, str) for q in queries):
+        return jsonify({"error": "queries must be a list of strings"}), 400
+    queries = [q.strip() for q in queries]
+    if len(queries) > MAX_BATCH_QUERIES:
+        return jsonify({"error": f"at most {MAX_BATCH_QUERIES} queries per batch"}), 400
+
+    try:
+        start = time.perf_counter()
+        engine = engines.get(nid)
+        timings = {"engine": time.perf_counter() - start}
+        results = engine.search_batch(queries, k, timings)
+        timings["total"] = time.perf_counter() - start
+        response = jsonify({"results": [{"query": q, "results": r} for q, r in zip(queries, results)]})
+        response.headers["Server-Timing"] = server_timing(timings)
+        return response
     except FileNotFoundError as e:
         return jsonify({"error": str(e)}), 404
     except Exception as e:
@@ -36,3 +115,21 @@ def search():
 @app.get("/api/health")
 def health():
     return {"ok": True}
+
+@app.get("/api/ready")
+def ready():
+    # 503 until every registered course has been loaded (or found missing)
+    body = {"ready": warmed.is_set(), "courses": dict(course_status)}
+    return jsonify(body), 200 if warmed.is_set() else 503
+
+@app.get("/api/stats")
+def stats():
+    return jsonify({"query_cache": query_cache.stats()})
+
+@app.get("/api/metrics")
+def metrics():
+    # this process's metrics, followed by the builder's from its last pass
+    body = REGISTRY.render()
+    if BUILD_METRICS_FILE.exists():
+        body += BUILD_METRICS_FILE.read_text(encoding="utf-8")
+    return body, 200, {"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
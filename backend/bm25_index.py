@@ -0,0 +1,322 @@
+import os
+import re
+import math
+import json
+import struct
+import numpy as np
+from pathlib import Path
+
+# persisted BM25 keyword index.
+#
+# file layout (little-endian): an 8-byte magic, a uint32 header length, a json
+# header with corpus statistics and section offsets, then 8-byte aligned raw
+# arrays. terms are stored sorted so a query term is found by binary search
+# over the memory-mapped blob; opening the index never touches the postings.
+#
+#   doc_len      int32[n_docs]       tokens per post
+#   id_offsets   int64[n_docs + 1]   post id boundaries in id_blob
+#   id_blob      uint8[...]          utf-8 post ids, concatenated
+#   term_offsets int64[n_terms + 1]  term boundaries in term_blob
+#   term_blob    uint8[...]          utf-8 terms, sorted, concatenated
+#   idf          float64[n_terms]
+#   indptr       int64[n_terms + 1]  postings boundaries per term
+#   postings     int32[n_postings]   doc indices, ascending within a term
+#   tfs          int32[n_postings]   term frequency per posting
+#   weights      float64[n_postings] precomputed BM25 term weight per posting
+#
+# indptr/postings/weights form a CSR term-document matrix, so scoring a query
+# is a gather of its terms' rows followed by a per-document sum.
+
+MAGIC = b"PZBM25\x00\x02"
+TOKEN_RE = re.compile(r"[A-Za-z]+|\d+")
+
+# same defaults as rank_bm25.BM25Okapi
+K1 = 1.5
+B = 0.75
+EPSILON = 0.25
+
+SECTIONS = [
+    ("doc_len", np.int32),
+    ("id_offsets", np.int64),
+    ("id_blob", np.uint8),
+    ("term_offsets", np.int64),
+    ("term_blob", np.uint8),
+    ("idf", np.float64),
+    ("indptr", np.int64),
+    ("postings", np.int32),
+    ("tfs", np.int32),
+    ("weights", np.float64),
+]
+
+
+def tokenize(text: str) -> list:
+    return TOKEN_RE.findall(text.lower())
+
+
+def _pack_strings(strings):
+    encoded = [s.encode("utf-8") for s in strings]
+    offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+    if encoded:
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+    blob = np.frombuffer(b"".join(encoded), dtype=np.uint8)
+    return offsets, blob
+
+
+def index_is_current(path: Path) -> bool:
+    """True if path holds an index in the current file format."""
+    try:
+        with open(path, "rb") as f:
+            return f.read(len(MAGIC)) == MAGIC
+    except FileNotFoundError:
+        return False
+
+
+def _calc_idf(n_docs: int, doc_freq: list) -> list:
+    # mirrors BM25Okapi._calc_idf term for term (math.log and a sequential sum,
+    # in first-seen order) so the epsilon floor for common terms is bit-identical
+    idf = [math.log(n_docs - freq + 0.5) - math.log(freq + 0.5) for freq in doc_freq]
+    if idf:
+        eps = EPSILON * (sum(idf) / len(idf))
+        idf = [eps if v < 0 else v for v in idf]
+    return idf
+
+
+class BM25Index:
+    """
+    Array-backed BM25 index over whole-post text. Build it with from_corpus or
+    update, write it with save, and open a saved file memory-mapped with load.
+    """
+    def __init__(self, arrays: dict, n_docs: int, avgdl: float):
+        self.n_docs = n_docs
+        self.avgdl = avgdl
+        for name, _ in SECTIONS:
+            setattr(self, name, arrays[name])
+        self.n_terms = len(self.term_offsets) - 1
+
+    # --- construction ---
+
+    @classmethod
+    def from_corpus(cls, post_ids: list, tokenized: list):
+        empty = np.zeros(0, dtype=np.int64)
+        return cls._from_coo(list(post_ids), [], empty, empty, empty, empty, tokenized)
+
+    @classmethod
+    def _from_coo(cls, post_ids, terms, term_ids, doc_ids, tfs, old_doc_len, tokenized):
+        """
+        Build from existing (term, doc, tf) triples over `terms` plus freshly
+        tokenized documents appended after them; post_ids covers both.
+        """
+        n_old = len(old_doc_len)
+        vocab = {t: i for i, t in enumerate(terms)}
+        new_terms, new_docs, new_tfs = [], [], []
+        doc_len = list(old_doc_len)
+        for offset, tokens in enumerate(tokenized):
+            counts = {}
+            for tok in tokens:
+                counts[tok] = counts.get(tok, 0) + 1
+            for tok, tf in counts.items():
+                new_terms.append(vocab.setdefault(tok, len(vocab)))
+                new_docs.append(n_old + offset)
+                new_tfs.append(tf)
+            doc_len.append(len(tokens))
+
+        # sort the vocabulary, dropping terms left without postings, and remap term ids onto it
+        all_terms = list(vocab)
+        term_ids = np.concatenate([term_ids, np.asarray(new_terms, dtype=np.int64)])
+        doc_freq = np.bincount(term_ids, minlength=len(all_terms))
+        present = np.flatnonzero(doc_freq)
+        order = sorted(present.tolist(), key=all_terms.__getitem__)
+        remap = np.full(len(all_terms), -1, dtype=np.int64)
+        remap[order] = np.arange(len(order))
+        sorted_terms = [all_terms[i] for i in order]
+        n_docs = len(post_ids)
+        idf = np.empty(len(order))
+        idf[remap[present]] = _calc_idf(n_docs, doc_freq[present].tolist())
+
+        term_ids = remap[term_ids]
+        doc_ids = np.concatenate([doc_ids, np.asarray(new_docs, dtype=np.int64)])
+        tfs = np.concatenate([tfs, np.asarray(new_tfs, dtype=np.int64)])
+
+        # group postings by term, doc order within each term
+        perm = np.lexsort((doc_ids, term_ids))
+        term_ids, doc_ids, tfs = term_ids[perm], doc_ids[perm], tfs[perm]
+        indptr = np.zeros(len(sorted_terms) + 1, dtype=np.int64)
+        np.cumsum(np.bincount(term_ids, minlength=len(sorted_terms)), out=indptr[1:])
+
+        doc_len = np.asarray(doc_len, dtype=np.int32)
+        avgdl = float(np.sum(doc_len, dtype=np.int64)) / n_docs if n_docs else 0.0
+        id_offsets, id_blob = _pack_strings(post_ids)
+        term_offsets, term_blob = _pack_strings(sorted_terms)
+
+        # same expression and operation order as BM25Okapi.get_scores, so sums match bit for bit
+        tf = tfs.astype(np.float64)
+        dl = doc_len[doc_ids]
+        weights = np.repeat(idf, np.diff(indptr)) * (tf * (K1 + 1) /
+                                                    (tf + K1 * (1 - B + B * dl / avgdl)))
+        arrays = {
+            "doc_len": doc_len,
+            "id_offsets": id_offsets,
+            "id_blob": id_blob,
+            "term_offsets": term_offsets,
+            "term_blob": term_blob,
+            "idf": idf,
+            "indptr": indptr,
+            "postings": doc_ids.astype(np.int32),
+            "tfs": tfs.astype(np.int32),
+            "weights": weights,
+        }
+        return cls(arrays, n_docs, avgdl)
+
+    def update(self, docs: dict, removed=()):
+        """
+        Return a new index with `docs` (post_id -> tokens) added or replaced
+        and `removed` post ids dropped. Only the new documents are tokenized;
+        existing postings are carried over as arrays.
+        """
+        drop = set(removed) | set(docs)
+        old_ids = self.post_ids()
+        keep = np.array([pid not in drop for pid in old_ids], dtype=bool)
+        new_index = np.full(self.n_docs, -1, dtype=np.int64)
+        new_index[keep] = np.arange(int(keep.sum()))
+
+        # expand CSR to (term, doc, tf) triples and drop replaced/removed docs
+        term_ids = np.repeat(np.arange(self.n_terms, dtype=np.int64), np.diff(self.indptr))
+        doc_ids = new_index[np.asarray(self.postings, dtype=np.int64)]
+        live = doc_ids >= 0
+        kept_ids = [pid for pid, k in zip(old_ids, keep) if k]
+
+        return type(self)._from_coo(
+            kept_ids + list(docs), self.terms(),
+            term_ids[live], doc_ids[live], np.asarray(self.tfs, dtype=np.int64)[live],
+            np.asarray(self.doc_len)[keep], list(docs.values()),
+        )
+
+    # --- persistence ---
+
+    def save(self, path: Path):
+        """Write the index atomically; readers holding the old file keep a valid mapping."""
+        path = Path(path)
+        sections, offset = {}, 0
+        for name, dtype in SECTIONS:
+            arr = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+            sections[name] = (offset, len(arr))
+            offset += (arr.nbytes + 7) // 8 * 8
+        header = json.dumps({
+            "n_docs": self.n_docs,
+            "avgdl": self.avgdl,
+            "sections": sections,
+        }).encode("utf-8")
+        header += b" " * (-(len(MAGIC) + 4 + len(header)) % 8)
+
+        tmp = path.with_suffix(path.suffix + ".tmp")
+        with open(tmp, "wb") as f:
+            f.write(MAGIC)
+            f.write(struct.pack("<I", len(header)))
+            f.write(header)
+            for name, dtype in SECTIONS:
+                arr = np.ascontiguousarray(getattr(self, name), dtype=dtype)
+                f.write(arr.tobytes())
+                f.write(b"\x00" * (-arr.nbytes % 8))
+        os.replace(tmp, path)
+
+    @classmethod
+    def load(cls, path: Path):
+        """Memory-map a saved index. Cost is independent of corpus size."""
+        with open(path, "rb") as f:
+            if f.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f"{path} is not a BM25 index file")
+            (header_len,) = struct.unpack("<I", f.read(4))
+            header = json.loads(f.read(header_len))
+        data_start = len(MAGIC) + 4 + header_len
+
+        buf = np.memmap(path, dtype=np.uint8, mode="r")
+        arrays = {}
+        for name, dtype in SECTIONS:
+            offset, count = header["sections"][name]
+            start = data_start + offset
+            arrays[name] = buf[start:start + count * np.dtype(dtype).itemsize].view(dtype)
+        return cls(arrays, header["n_docs"], header["avgdl"])
+
+    @property
+    def nbytes(self) -> int:
+        return sum(getattr(self, name).nbytes for name, _ in SECTIONS)
+
+    # --- lookup ---
+
+    def _string(self, offsets, blob, i) -> str:
+        return bytes(blob[offsets[i]:offsets[i + 1]]).decode("utf-8")
+
+    def post_id(self, doc: int) -> str:
+        return self._string(self.id_offsets, self.id_blob, doc)
+
+    def post_ids(self) -> list:
+        return [self.post_id(i) for i in range(self.n_docs)]
+
+    def terms(self) -> list:
+        return [self._string(self.term_offsets, self.term_blob, i) for i in range(self.n_terms)]
+
+    def term_id(self, term: str) -> int:
+        """Binary search the sorted vocabulary; -1 if the term is unknown."""
+        lo, hi = 0, self.n_terms
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._string(self.term_offsets, self.term_blob, mid) < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        if lo < self.n_terms and self._string(self.term_offsets, self.term_blob, lo) == term:
+            return lo
+        return -1
+
+    # --- scoring ---
+
+    def _rows(self, tokens: list):
+        # gather the CSR rows of the query terms, repeated terms included
+        spans = [(self.indptr[t], self.indptr[t + 1]) for t in map(self.term_id, tokens) if t >= 0]
+        if not spans:
+            return np.zeros(0, dtype=np.int32), np.zeros(0)
+        docs = np.concatenate([self.postings[lo:hi] for lo, hi in spans])
+        weights = np.concatenate([self.weights[lo:hi] for lo, hi in spans])
+        return docs, weights
+
+    def get_scores(self, tokens: list) -> np.ndarray:
+        """BM25 score of every post, identical to BM25Okapi.get_scores."""
+        docs, weights = self._rows(tokens)
+        # bincount adds in row order, i.e. term by term like BM25Okapi
+        return np.bincount(docs, weights=weights, minlength=self.n_docs)
+
+    def get_scores_batch(self, token_lists: list) -> np.ndarray:
+        """
+        Scores of many queries, one row per query, each identical to get_scores.
+        Rows are filled one query at a time: a single bincount over all queries
+        scatters into a matrix too big for the CPU cache and measured ~3x slower.
+        """
+        scores = np.empty((len(token_lists), self.n_docs))
+        for row, tokens in zip(scores, token_lists):
+            docs, weights = self._rows(tokens)
+            row[:] = np.bincount(docs, weights=weights, minlength=self.n_docs)
+        return scores
+
+    def top_n_docs(self, scores: np.ndarray, n: int) -> np.ndarray:
+        """Indices of the n best scores, highest first, ties broken by document order."""
+        n = min(n, len(scores))
+        if n <= 0:
+            return np.zeros(0, dtype=np.int64)
+        if n < len(scores):
+            cutoff = scores[np.argpartition(-scores, n - 1)[n - 1]]
+            # everything above the n-th score, then the earliest documents tied with it
+            above = np.flatnonzero(scores > cutoff)
+            tied = np.flatnonzero(scores == cutoff)[:n - len(above)]
+            candidates = np.concatenate([above, tied])
+        else:
+            candidates = np.arange(len(scores))
+        order = np.lexsort((candidates, -scores[candidates]))
+        return candidates[order]
+
+    def get_top_n(self, tokens: list, n: int = 100) -> list:
+        top = self.top_n_docs(self.get_scores(tokens), n)
+        return [self.post_id(i) for i in top]
+
+    def get_top_n_batch(self, token_lists: list, n: int = 100) -> list:
+        scores = self.get_scores_batch(token_lists)
+        return [[self.post_id(i) for i in self.top_n_docs(row, n)] for row in scores]
@@ -1,16 +1,25 @@
+import os
 import json
-import re
 import time
-import base64
-import httpx
+import uuid
 import logging
+import numpy as np
 from pathlib import Path
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from dotenv import load_dotenv
 from langchain_core.documents import Document
 from langchain_chroma import Chroma
 from langchain_openai import OpenAIEmbeddings, ChatOpenAI
-from rank_bm25 import BM25Okapi
-from utils import sha1_of_file, clean_text, to_cdn_url, splitter
+from bm25_index import BM25Index, tokenize, index_is_current
+from captioning import Captioner
+from media_cache import MediaCache
+from embedding_store import EmbeddingStore
+from utils import clean_text, splitter, post_text, post_hash, BUILDER_FIELDS
+from post_store import PostStore
+from change_journal import ChangeJournal
+from chunking import Chunker
+from vector_index import INDEX_CONFIG_FILE, index_config, truncate_vectors
+from metrics import REGISTRY
 
 logging.basicConfig(
     level=logging.INFO,
@@ -28,174 +37,388 @@ load_dotenv()
 with open("auth.json", "r", encoding="utf-8") as f:
     auth_map = json.load(f)
 
-SCRAPE_INTERVAL = 5 * 60  # seconds between updates
+SCRAPE_INTERVAL = 5 * 60  # seconds between full passes over every course (fallback)
+WATCH_INTERVAL = 3  # seconds between checks of the scraper's change journal
+EMBED_BATCH_SIZE = 256  # chunks per embedding request
+EMBED_CONCURRENCY = 4  # embedding requests in flight at once
+CHROMA_WRITE_BATCH = 1000  # chunks per chroma insert
+MAX_CAPTION_CYCLES = 10  # update cycles an image may fail before it is given up on
+VECTOR_DIM = int(os.environ.get("VECTOR_DIM", "0"))  # for courses without "vector_dim" in auth.json; 0 keeps all
 embedding_model = OpenAIEmbeddings(model="text-embedding-3-large")
+embedding_store = EmbeddingStore(embedding_model.model)
 llm_vision = ChatOpenAI(model_name="gpt-4o-mini")
+captioner = Captioner(llm_vision, MediaCache())
+
+# build metrics, written to METRICS_FILE after every pass for the API's /api/metrics to include
+METRICS_FILE = Path("data") / "metrics" / "build_db.prom"
+BUILD_STAGE_SECONDS = REGISTRY.histogram(
+    "piazzaplus_build_stage_seconds", "Time spent in each stage of update_database.", ("course", "stage"))
+BUILD_POSTS = REGISTRY.counter(
+    "piazzaplus_build_posts_total", "Posts re-indexed or removed, by kind of change.", ("course", "change"))
+BUILD_CHUNKS = REGISTRY.counter(
+    "piazzaplus_build_chunks_total", "Chunks written to Chroma, by where their embedding came from.",
+    ("course", "source"))
+BUILD_UPDATES = REGISTRY.counter(
+    "piazzaplus_build_updates_total", "update_course calls by outcome.", ("course", "result"))
+index_sizes = {}  # (course_code, index) -> size; "posts" counts indexed posts, the rest are bytes
+REGISTRY.gauge("piazzaplus_index_size", "Indexed posts and index file bytes per course.",
+               lambda: dict(index_sizes), ("course", "index"))
+REGISTRY.gauge("piazzaplus_caption_cache_hit_ratio", "Caption cache hit rate per table over the last pass.",
+               lambda: {table: st["hit_rate"] for table, st in captioner.cache.stats().items()}, ("table",))
+
+
+def embed_and_store(db, docs):
+    """
+    Embed chunks from many posts and write them to Chroma. Chunks whose text is
+    already in the embedding store are not sent to the API; the remaining
+    unique texts are embedded in batches of EMBED_BATCH_SIZE with up to
+    EMBED_CONCURRENCY requests in flight and appended to the store. Chroma
+    writes stay on the calling thread and read their vectors back from the
+    store one CHROMA_WRITE_BATCH at a time, so a full build never holds every
+    chunk vector in memory.
+    """
+    if not docs:
+        return
+    texts = [d.page_content for d in docs]
+    rows = embedding_store.rows(texts)
+    missing = list(dict.fromkeys(t for t, r in zip(texts, rows) if r is None))
+    n_cached = sum(r is not None for r in rows)
+    BUILD_CHUNKS.inc(n_cached, course=course_code, source="store")
+    BUILD_CHUNKS.inc(len(texts) - n_cached, course=course_code, source="api")
+    print(f"{n_cached}/{len(texts)} chunks found in the embedding store; "
+          f"embedding {len(missing)} unique chunks...")
+
+    embed_start = time.perf_counter()
+    if missing:
+        batches = [missing[i:i + EMBED_BATCH_SIZE] for i in range(0, len(missing), EMBED_BATCH_SIZE)]
+        start = time.perf_counter()
+        done = 0
+        with ThreadPoolExecutor(max_workers=EMBED_CONCURRENCY) as pool:
+            futures = {pool.submit(embedding_model.embed_documents, batch): batch for batch in batches}
+            for n, future in enumerate(as_completed(futures), start=1):
+                batch = futures[future]
+                embedding_store.put_many(batch, future.result())
+                done += len(batch)
+                rate = done / (time.perf_counter() - start)
+                print(f"Embedded batch {n}/{len(batches)}: {done}/{len(missing)} chunks ({rate:.1f} chunks/sec)")
+
+    BUILD_STAGE_SECONDS.observe(time.perf_counter() - embed_start, course=course_code, stage="embed")
+
+    # bulk writes to chroma, shortened to the course's vector_dim (the store keeps full vectors)
+    write_start = time.perf_counter()
+    for i in range(0, len(docs), CHROMA_WRITE_BATCH):
+        batch = docs[i:i + CHROMA_WRITE_BATCH]
+        vectors = np.stack(embedding_store.get_many(texts[i:i + CHROMA_WRITE_BATCH]))
+        db._collection.add(
+            ids=[str(uuid.uuid4()) for _ in batch],
+            embeddings=truncate_vectors(vectors, vector_dim).tolist(),
+            metadatas=[d.metadata for d in batch],
+            documents=[d.page_content for d in batch],
+        )
+    BUILD_STAGE_SECONDS.observe(time.perf_counter() - write_start, course=course_code, stage="chroma_write")
+
+
+def caption_images(data, jobs, attempts=None):
+    """
+    Caption (post id, image url) jobs concurrently and append the captions to
+    their posts in job order. Images that still fail after retries are
+    returned as a retry queue {post id: {url: failed cycles}} so a later
+    cycle can try them again; after MAX_CAPTION_CYCLES they are dropped.
+    """
+    results = captioner.caption_all([url for _, url in jobs])
+    failed = {}
+    for (pid, url), result in zip(jobs, results):
+        if not isinstance(result, Exception):
+            data[pid].setdefault('captions', []).append(result)
+            continue
+        tries = (attempts or {}).get(pid, {}).get(url, 0) + 1
+        print(f"\n#{pid}: Image caption failed for {url} (cycle {tries}): {result}")
+        logging.error(f"\nFor course: {course_code}, post #{pid}: Image caption failed for {url} (cycle {tries}): {result}")
+        if tries < MAX_CAPTION_CYCLES:
+            failed.setdefault(pid, {})[url] = tries
+    return failed
+
+
+def open_chroma():
+    """The course's Chroma collection, created if missing."""
+    return Chroma(
+        persist_directory=str(persist_dir),
+        embedding_function=embedding_model,
+        collection_metadata={"hnsw:space": "cosine"}
+    )
+
+
+def chunk_post(pid, post):
+    """Split a post (with any captions) into chunks for embedding, using the course's chunker."""
+    subj = post.get('subject','').strip()
+    cont = post.get('content','').strip()
+    ia = post.get('instructor_answer','').strip()
+    ea = post.get('endorsed_answer','').strip()
+    full = ' '.join(filter(None,[subj,cont,ia,ea]))
+    if post.get('captions'):
+        full += ' ' + ' '.join(post['captions'])
+        post['full_text'] = full
+    return [Document(page_content=chunk, metadata={'post_id':pid,'subject':subj,'idx':i})
+            for i,chunk in enumerate(chunker.chunk(splitter.split_text(clean_text(full))))]
 
 
 def update_database():
     """
-    Incrementally build or update the Chroma vector DB using globals:
-      persist_dir, hash_file, json_path, vector_file,
-      embedding_model, llm_vision
+    Incrementally build or update the Chroma vector DB and the BM25 index using globals:
+      persist_dir, store, indexed_file, seq_file, vector_file, bm25_file,
+      retry_file, chunker, vector_dim, embedding_model, captioner
+    Only posts the store reports as changed since the last indexed sequence
+    number are read, and each is compared by content hash against the manifest
+    of what is indexed, so added, edited and removed posts are all picked up.
+    If the course's chunking strategy or vector_dim differs from the one
+    recorded in the index config, every indexed post is re-chunked with its
+    existing captions; a new vector_dim also recreates the Chroma collection,
+    whose dimension is fixed.
     """
     # ensure storage directory exists
     persist_dir.mkdir(parents=True, exist_ok=True)
 
-    # incremental vs initial build
-    if persist_dir.exists() and hash_file.exists():
-        db = Chroma(
-            persist_directory=str(persist_dir),
-            embedding_function=embedding_model,
-            collection_metadata={"hnsw:space": "cosine"}
-        )
-        # compare posts.json hash
-        current_hash = sha1_of_file(str(json_path))
-        last_hash = hash_file.read_text()
-        if current_hash == last_hash:
-            print("No new posts to vectorize.")
-            return
+    # incremental vs initial build (vectorized_ids.json marks indexes from before the manifest)
+    if indexed_file.exists() or vector_file.exists():
+        db = open_chroma()
+        # missing or older-format keyword index: build it once from all posts
+        if not index_is_current(bm25_file):
+            print("Building keyword index...")
+            data = store.all()
+            BM25Index.from_corpus(list(data), [tokenize(post_text(p)) for p in data.values()]).save(bm25_file)
 
-        # load previously vectorized IDs
-        if vector_file.exists():
-            with open(vector_file, 'r', encoding='utf-8') as vf:
-                vectorized_ids = set(json.load(vf))
+        if indexed_file.exists():
+            indexed = json.loads(indexed_file.read_text(encoding='utf-8'))
+            last_seq = int(seq_file.read_text()) if seq_file.exists() else 0
         else:
-            vectorized_ids = set()
+            # adopt the current content of posts indexed before hashes were tracked
+            hashes = store.hashes()
+            vectorized_ids = json.loads(vector_file.read_text(encoding='utf-8'))
+            indexed = {pid: hashes[pid] for pid in vectorized_ids if pid in hashes}
+            last_seq = 0
 
-        print("Detected changes; updating vector database...")
-        data = json.loads(Path(json_path).read_text(encoding="utf-8"))
-        new_ids = [pid for pid in data if pid not in vectorized_ids]
-        if not new_ids:
-            print("No unvectorized posts found.")
+        # images whose captions failed in an earlier cycle
+        if retry_file.exists():
+            retry_queue = json.loads(retry_file.read_text(encoding='utf-8'))
         else:
-            for pid in new_ids:
-                post = data[pid]
-                subj = post.get('subject','').strip()
-                cont = post.get('content','').strip()
-                ia = post.get('instructor_answer','').strip()
-                ea = post.get('endorsed_answer','').strip()
-                full = ' '.join(filter(None,[subj,cont,ia,ea]))
-
-                # caption images
-                captions = []
-                for url in post.get('image_urls',[]):
-                    try:
-                        cdn = to_cdn_url(url)
-                        img = httpx.get(cdn, follow_redirects=True, timeout=10).content
-                        enc = base64.b64encode(img).decode('utf-8')
-                        msg = {"role":"user","content":[
-                            {"type":"text","text":"Please describe this image to someone who is struggling in the course. Please describe all drawings and transcribe any text. Use up to 200 words."},
-                            {"type":"image","source_type":"base64","data":enc,"mime_type":"image/png"},
-                        ]}
-                        resp = llm_vision.invoke([msg])
-                        time.sleep(1)
-                        captions.append(resp.content)
-                    except Exception as e:
-                        print(f"\n#{pid}: Image caption failed for {cdn}: {e}")
-                        logging.error(f"\nFor course: {course_code}, post #{pid}: Image caption failed for {cdn}: {e}", exc_info=True)
-                if captions:
-                    full += ' ' + ' '.join(captions)
-                    post['captions'] = captions
-                    post['full_text'] = full + " " + " ".join(captions)
-
-                # chunk & embed
-                chunks = splitter.split_text(clean_text(full))
-                docs = [Document(page_content=chunk, metadata={'post_id':pid,'subject':subj,'idx':i})
-                        for i,chunk in enumerate(chunks)]
-                print(f"Embedding {len(docs)} chunks for post {pid}...")
-                db.add_documents(docs)
-                vectorized_ids.add(pid)
-
-            # save vectorized IDs
-            Path(vector_file).write_text(json.dumps(list(vectorized_ids), indent=2), encoding='utf-8')
-
-            Path(json_path).write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
-
-        # update hash
-        hash_file.write_text(current_hash)
+            retry_queue = {}
+
+        # how the existing vectors were built
+        indexed_config = index_config(persist_dir)
+        resize = indexed_config.get("vector_dim") != vector_dim
+
+        # posts changed since the last indexed sequence number, by content hash
+        read_start = time.perf_counter()
+        rows = store.changed_since(last_seq)
+        added, modified, removed = [], [], []
+        for pid, digest, deleted, _ in rows:
+            if deleted:
+                if pid in indexed:
+                    removed.append(pid)
+            elif pid not in indexed:
+                added.append(pid)
+            elif indexed[pid] != digest:
+                modified.append(pid)
+        rechunk = []
+        if indexed_config["chunking"] != chunker.spec or resize:
+            print(f"Index config changed from {indexed_config} to chunking {chunker.spec}, "
+                  f"vector_dim {vector_dim}; re-chunking all posts...")
+            skip = set(modified) | set(removed)
+            rechunk = [pid for pid in indexed if pid not in skip]
+        if not (added or modified or removed or retry_queue or rechunk):
+            if rows:
+                seq_file.write_text(str(rows[-1][3]))
+            print("No new posts to vectorize.")
+            return
+
+        print(f"Detected changes: {len(added)} new, {len(modified)} edited, {len(removed)} removed posts; "
+              f"updating vector database...")
+        data = store.get_many(list(dict.fromkeys(
+            added + modified + [pid for pid in retry_queue if pid in indexed] + rechunk)))
+        modified = [pid for pid in modified if pid in data]
+        changed = [pid for pid in added if pid in data] + modified
+        retry_ids = [pid for pid in retry_queue if pid in data and pid not in changed]
+        BUILD_STAGE_SECONDS.observe(time.perf_counter() - read_start, course=course_code, stage="read")
+
+        # caption new and edited posts from scratch and retry previously failed images
+        for pid in changed:
+            data[pid].pop('captions', None)
+            data[pid].pop('full_text', None)
+        jobs = [(pid, url) for pid in changed for url in data[pid].get('image_urls', [])]
+        jobs += [(pid, url) for pid in retry_ids for url in retry_queue[pid]]
+        captions_before = {pid: len(data[pid].get('captions', [])) for pid in retry_ids}
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="caption"):
+            failed = caption_images(data, jobs, retry_queue)
+
+        # posts that gained a caption on retry are re-indexed like edited ones; images
+        # dropped after MAX_CAPTION_CYCLES leave the post's text, and its chunks, unchanged
+        recaptioned = [pid for pid in retry_ids if len(data[pid].get('captions', [])) > captions_before[pid]]
+        rechunk = [pid for pid in rechunk if pid in data and pid not in recaptioned]
+        reindex = changed + recaptioned + rechunk
+
+        # drop the stale chunks of edited, re-captioned, re-chunked and removed posts
+        stale = modified + recaptioned + rechunk + removed
+        if resize:
+            with BUILD_STAGE_SECONDS.time(course=course_code, stage="chroma_delete"):
+                db.delete_collection()
+                db = open_chroma()
+        elif stale:
+            with BUILD_STAGE_SECONDS.time(course=course_code, stage="chroma_delete"):
+                for i in range(0, len(stale), CHROMA_WRITE_BATCH):
+                    db._collection.delete(where={"post_id": {"$in": stale[i:i + CHROMA_WRITE_BATCH]}})
+
+        # chunk; embedding happens below, batched across posts
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="chunk"):
+            docs = [doc for pid in reindex for doc in chunk_post(pid, data[pid])]
+        print(f"Embedding {len(docs)} chunks for {len(reindex)} posts...")
+        embed_and_store(db, docs)
+
+        # keyword index: replace re-indexed posts, drop removed ones
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="bm25"):
+            bm25 = BM25Index.load(bm25_file)
+            bm25.update({pid: tokenize(post_text(data[pid])) for pid in reindex}, removed=removed).save(bm25_file)
+
+        # record captions, what is now indexed and the images still waiting for a caption
+        manifest_start = time.perf_counter()
+        store.set_annotations({pid: {k: data[pid][k] for k in BUILDER_FIELDS if k in data[pid]}
+                               for pid in reindex})
+        for pid in reindex:
+            indexed[pid] = post_hash(data[pid])
+        for pid in removed:
+            indexed.pop(pid, None)
+        indexed_file.write_text(json.dumps(indexed, indent=2), encoding='utf-8')
+        if rows:
+            seq_file.write_text(str(rows[-1][3]))
+        retry_file.write_text(json.dumps(failed, indent=2), encoding='utf-8')
+        write_index_config()
+        vector_file.unlink(missing_ok=True)
+        BUILD_STAGE_SECONDS.observe(time.perf_counter() - manifest_start, course=course_code, stage="manifest")
+        BUILD_POSTS.inc(len(added), course=course_code, change="added")
+        BUILD_POSTS.inc(len(modified) + len(recaptioned), course=course_code, change="modified")
+        BUILD_POSTS.inc(len(rechunk), course=course_code, change="rechunked")
+        BUILD_POSTS.inc(len(removed), course=course_code, change="removed")
+        index_sizes[(course_code, "posts")] = len(indexed)
         print("Update complete.")
 
     else:
         # full initial build
         print("Performing initial full build...")
         start = time.perf_counter()
-        data = json.loads(Path(json_path).read_text(encoding='utf-8'))
-
-        docs, texts = [], []
-        for pid, post in data.items():
-            subj = post.get('subject','').strip()
-            cont = post.get('content','').strip()
-            ia = post.get('instructor_answer','').strip()
-            ea = post.get('endorsed_answer','').strip()
-            full = ' '.join(filter(None,[subj,cont,ia,ea]))
-            texts.append(full)
-
-            # caption images (same as above)
-            caps=[]
-            for url in post.get('image_urls',[]):
-                try:
-                    cdn = to_cdn_url(url)
-                    img = httpx.get(cdn, follow_redirects=True, timeout=10).content
-                    enc = base64.b64encode(img).decode('utf-8')
-                    msg={"role":"user","content":[
-                        {"type":"text","text":"Please describe this image to someone who is struggling in the course. Please describe all drawings and transcribe any text. Use up to 200 words."},
-                        {"type":"image","source_type":"base64","data":enc,"mime_type":"image/png"},
-                    ]}
-                    r=llm_vision.invoke([msg]); time.sleep(1)
-                    caps.append(r.content)
-                except Exception as e:
-                    print(f"\n#{pid}: Image caption failed for {cdn}: {e}") # future work: retry if i get rate limit exceed
-                    logging.error(f"\nFor course: {course_code}, post #{pid}: Image caption failed for {cdn}: {e}", exc_info=True)
-            if caps:
-                full += ' ' + ' '.join(caps)
-                post['captions'] = caps
-                post['full_text'] = full + " " + " ".join(caps)
-
-            # chunk
-            for i,chunk in enumerate(splitter.split_text(clean_text(full))):
-                docs.append(Document(page_content=chunk, metadata={'post_id':pid,'subject':subj,'idx':i}))
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="read"):
+            last_seq = store.max_seq()
+            data = store.all()
+
+        # caption every image concurrently, then chunk
+        for post in data.values():
+            post.pop('captions', None)
+            post.pop('full_text', None)
+        jobs = [(pid, url) for pid, post in data.items() for url in post.get('image_urls', [])]
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="caption"):
+            failed = caption_images(data, jobs)
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="chunk"):
+            docs = [doc for pid, post in data.items() for doc in chunk_post(pid, post)]
 
         print(f"Embedding total {len(docs)} chunks...")
-        db = Chroma.from_documents(
-            documents=docs,
-            embedding=embedding_model,
-            persist_directory=str(persist_dir),
-            collection_metadata={"hnsw:space":"cosine"}
-        )
+        db = open_chroma()
+        embed_and_store(db, docs)
+
+        # keyword index over whole-post text, persisted next to the vector DB
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="bm25"):
+            BM25Index.from_corpus(list(data), [tokenize(post_text(p)) for p in data.values()]).save(bm25_file)
 
         # record initial state
-        current_hash = sha1_of_file(str(json_path))
-        hash_file.write_text(current_hash)
-        Path(vector_file).write_text(json.dumps(list(data.keys()), indent=2), encoding='utf-8')
-        Path(json_path).write_text(json.dumps(data, indent=2, ensure_ascii=False), encoding='utf-8')
+        manifest_start = time.perf_counter()
+        store.set_annotations({pid: {k: post[k] for k in BUILDER_FIELDS if k in post}
+                               for pid, post in data.items()})
+        indexed = {pid: post_hash(post) for pid, post in data.items()}
+        indexed_file.write_text(json.dumps(indexed, indent=2), encoding='utf-8')
+        seq_file.write_text(str(last_seq))
+        retry_file.write_text(json.dumps(failed, indent=2), encoding='utf-8')
+        write_index_config()
+        BUILD_STAGE_SECONDS.observe(time.perf_counter() - manifest_start, course=course_code, stage="manifest")
+        BUILD_POSTS.inc(len(data), course=course_code, change="added")
+        index_sizes[(course_code, "posts")] = len(indexed)
         elapsed = time.perf_counter() - start
         print(f"Initial build done in {elapsed:.2f}s.")
 
-        # BM25 indexing (unchanged)
-        tokenized = [re.findall(r"[A-Za-z]+|\d+", t.lower()) for t in texts]
-        bm25 = BM25Okapi(tokenized)
+
+def write_index_config():
+    """Record how this course's vectors were built, for the next update and for search_lib."""
+    config_file.write_text(json.dumps({"chunking": chunker.spec, "vector_dim": vector_dim}), encoding='utf-8')
+
+
+stores = {}  # course_code -> PostStore, kept open between passes
+
+
+def update_course(code):
+    """Point the module globals at one course's files and bring its indexes up to date."""
+    global course_code, persist_dir, store, indexed_file, seq_file, vector_file, bm25_file, retry_file
+    global config_file, chunker, vector_dim
+    course_code = code
+    # per-course paths
+    data_dir = Path('data')
+    data_dir.mkdir(parents=True, exist_ok=True)
+    base_dir = data_dir / course_code
+    base_dir.mkdir(parents=True, exist_ok=True)
+    persist_dir  = base_dir / "db"
+    store        = stores.setdefault(course_code, PostStore.for_course(course_code))
+    indexed_file = persist_dir / "indexed_posts.json"
+    seq_file     = persist_dir / "indexed_seq.txt"
+    vector_file  = persist_dir / "vectorized_ids.json"
+    bm25_file    = base_dir / "bm25.bin"
+    retry_file   = persist_dir / "caption_retry.json"
+    config_file  = persist_dir / INDEX_CONFIG_FILE
+
+    try:
+        print(f"Starting update for {course_code}...")
+        chunker = Chunker(auth_map.get(course_code, {}).get("chunking"))
+        vector_dim = auth_map.get(course_code, {}).get("vector_dim") or VECTOR_DIM or None
+        store.migrate_json(base_dir / "posts.json")
+        with BUILD_STAGE_SECONDS.time(course=course_code, stage="total"):
+            update_database()
+        if bm25_file.exists():
+            index_sizes[(course_code, "bm25_bytes")] = bm25_file.stat().st_size
+        BUILD_UPDATES.inc(course=course_code, result="ok")
+        return True
+    except Exception as e:
+        print(f"[ERROR] {course_code}: {e}")
+        logging.error(f"\n[ERROR] {course_code}: {e}", exc_info=True)
+        BUILD_UPDATES.inc(course=course_code, result="error")
+        return False
 
 
 if __name__ == "__main__":
+    # the scraper appends to the journal after saving posts; we wake on it and
+    # only run the courses it names, with the timed full pass as a fallback
+    journal = ChangeJournal()
+    journal.seek_end()  # anything older is covered by the first full pass
+    next_full_pass = 0.0
     while True:
-        for course_code, creds in auth_map.items():
-            # per-course paths
-            data_dir = Path('data')
-            data_dir.mkdir(parents=True, exist_ok=True)
-            base_dir = data_dir / course_code
-            base_dir.mkdir(parents=True, exist_ok=True)
-            persist_dir = base_dir / "db"
-            hash_file   = persist_dir / "posts_hash.txt"
-            json_path   = base_dir / "posts.json"
-            vector_file = persist_dir / "vectorized_ids.json"
-
-            try:
-                print(f"Starting update for {course_code}...")
-                update_database()
-            except Exception as e:
-                print(f"[ERROR] {course_code}: {e}")
-                logging.error(f"\n[ERROR] {course_code}: {e}", exc_info=True)
-
-        print(f"Waiting {SCRAPE_INTERVAL} seconds until next update...")
-        time.sleep(SCRAPE_INTERVAL)
+        scraped_at = {}  # course_code -> time its oldest unindexed journal entry was written
+        if time.monotonic() >= next_full_pass:
+            courses = list(auth_map)
+            next_full_pass = time.monotonic() + SCRAPE_INTERVAL
+        else:
+            entries = journal.read_new()
+            if entries is None:
+                print("Change journal was rotated; running a full pass.")
+                next_full_pass = 0.0
+                continue
+            for entry in entries:
+                if entry["course"] in auth_map:
+                    scraped_at[entry["course"]] = min(entry["time"], scraped_at.get(entry["course"], entry["time"]))
+            courses = list(scraped_at)
+
+        for course_code in courses:
+            if update_course(course_code) and course_code in scraped_at:
+                print(f"{course_code}: scraped posts searchable {time.time() - scraped_at[course_code]:.1f}s after scrape")
+
+        if courses:
+            REGISTRY.write(METRICS_FILE)
+            # captioning cache hit rates for this pass
+            for table, st in captioner.cache.stats().items():
+                if st["hits"] or st["misses"]:
+                    print(f"Cache {table}: {st['hits']} hits, {st['misses']} misses ({st['hit_rate']:.0%} hit rate)")
+            captioner.cache.reset_stats()
+            print(f"Watching for scraped changes (full pass in {next_full_pass - time.monotonic():.0f} seconds)...")
+        time.sleep(WATCH_INTERVAL)
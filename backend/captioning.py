@@ -0,0 +1,149 @@
+import os
+import time
+import random
+import base64
+import hashlib
+import threading
+import httpx
+import requests
+from concurrent.futures import ThreadPoolExecutor
+from utils import to_cdn_url
+from media_cache import MediaCache, caption_key
+
+CAPTION_PROMPT = "Please describe this image to someone who is struggling in the course. Please describe all drawings and transcribe any text. Use up to 200 words."
+CAPTION_CONCURRENCY = int(os.environ.get("CAPTION_CONCURRENCY", "4"))  # images in flight at once
+CAPTION_RATE = float(os.environ.get("CAPTION_RATE", "1.0"))  # vision calls per second, sustained
+CAPTION_BURST = int(os.environ.get("CAPTION_BURST", "4"))  # vision calls allowed back to back
+MAX_RETRIES = 5
+BACKOFF_BASE = 1.0  # seconds, doubled per attempt
+BACKOFF_MAX = 60.0
+
+
+class TokenBucket:
+    """Blocking token bucket: `rate` tokens per second, holding at most `capacity`."""
+    def __init__(self, rate: float, capacity: int):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = float(capacity)
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+def is_retryable(exc: Exception) -> bool:
+    """Rate limits (429), server errors and network failures are worth retrying."""
+    status = getattr(exc, "status_code", None)
+    if status is None:
+        status = getattr(getattr(exc, "response", None), "status_code", None)
+    if status is not None:
+        return status == 429 or status >= 500
+    if isinstance(exc, (httpx.TransportError, requests.ConnectionError, requests.Timeout,
+                        ConnectionError, TimeoutError)):
+        return True
+    # openai client errors without a status code
+    return type(exc).__name__ in ("APIConnectionError", "APITimeoutError")
+
+
+def with_retries(fn, *args, **kwargs):
+    """Call fn, retrying retryable errors with jittered exponential backoff."""
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            return fn(*args, **kwargs)
+        except Exception as e:
+            if attempt == MAX_RETRIES or not is_retryable(e):
+                raise
+            delay = min(BACKOFF_MAX, BACKOFF_BASE * 2 ** attempt)
+            time.sleep(random.uniform(delay / 2, delay))
+
+
+def download_image(url: str) -> bytes:
+    resp = httpx.get(url, follow_redirects=True, timeout=10)
+    resp.raise_for_status()
+    return resp.content
+
+
+def describe_image(llm_vision, img: bytes) -> str:
+    enc = base64.b64encode(img).decode('utf-8')
+    msg = {"role":"user","content":[
+        {"type":"text","text":CAPTION_PROMPT},
+        {"type":"image","source_type":"base64","data":enc,"mime_type":"image/png"},
+    ]}
+    return llm_vision.invoke([msg]).content
+
+
+class Captioner:
+    """
+    Captions Piazza images concurrently. Downloads run CAPTION_CONCURRENCY at a
+    time; vision calls additionally share a token bucket so bursts of images
+    stay under the model's rate limit. With a MediaCache, redirects, image
+    hashes and captions are looked up before any network or LLM call.
+    """
+    def __init__(self, llm_vision, cache: MediaCache = None):
+        self.llm_vision = llm_vision
+        self.cache = cache
+        self.bucket = TokenBucket(CAPTION_RATE, CAPTION_BURST)
+
+    def _vision_call(self, img: bytes) -> str:
+        self.bucket.acquire()
+        return describe_image(self.llm_vision, img)
+
+    def caption(self, url: str) -> str:
+        if self.cache is None:
+            cdn = with_retries(to_cdn_url, url)
+            img = with_retries(download_image, cdn)
+            return with_retries(self._vision_call, img)
+
+        model = self.llm_vision.model_name
+        cdn = self.cache.get("redirects", url)
+        if cdn is not None:
+            digest = self.cache.get("images", cdn)
+            if digest is not None:
+                caption = self.cache.get("captions", caption_key(digest, model, CAPTION_PROMPT))
+                if caption is not None:
+                    return caption
+            try:
+                img = with_retries(download_image, cdn)
+            except Exception:
+                # cached CDN location may have expired; resolve the redirect again
+                self.cache.delete("redirects", url)
+                cdn = None
+        if cdn is None:
+            cdn = with_retries(to_cdn_url, url)
+            self.cache.put("redirects", url, cdn)
+            img = with_retries(download_image, cdn)
+
+        digest = hashlib.sha256(img).hexdigest()
+        self.cache.put("images", cdn, digest)
+        key = caption_key(digest, model, CAPTION_PROMPT)
+        caption = self.cache.get("captions", key)
+        if caption is None:
+            caption = with_retries(self._vision_call, img)
+            self.cache.put("captions", key, caption)
+        return caption
+
+    def caption_all(self, urls: list) -> list:
+        """
+        Caption every url; returns a list aligned with urls holding either the
+        caption or the exception that made it fail after all retries.
+        """
+        def run(url):
+            try:
+                return self.caption(url)
+            except Exception as e:
+                return e
+
+        if not urls:
+            return []
+        with ThreadPoolExecutor(max_workers=CAPTION_CONCURRENCY) as pool:
+            return list(pool.map(run, urls))
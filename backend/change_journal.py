@@ -0,0 +1,81 @@
+import os
+import json
+import time
+import uuid
+import threading
+from pathlib import Path
+
+CHANGE_JOURNAL_PATH = os.environ.get("CHANGE_JOURNAL_PATH", "data/changes.journal")
+CHANGE_JOURNAL_MAX_BYTES = int(os.environ.get("CHANGE_JOURNAL_MAX_BYTES", str(1 << 20)))  # rotate past this
+
+
+class ChangeJournal:
+    """
+    Append-only log the scraper writes after persisting posts, one json line
+    per batch: {"course": ..., "post_ids": [...], "time": unix seconds}.
+    The builder tails it from a byte offset and only wakes the courses named
+    there. Each entry is written in a single append, and a trailing partial
+    line is left for the next read. Past max_bytes the writer moves the file
+    to changes.journal.1. Every file starts with a line naming it, so the
+    reader notices a rotation and reports it; the builder then falls back to
+    a full pass.
+    """
+    def __init__(self, path=CHANGE_JOURNAL_PATH, max_bytes: int = CHANGE_JOURNAL_MAX_BYTES):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._reading, self._offset = None, 0  # id of the file being read and byte offset in it
+
+    def append(self, course_code: str, post_ids: list):
+        if not post_ids:
+            return
+        line = json.dumps({"course": course_code, "post_ids": list(post_ids), "time": time.time()}) + "\n"
+        with self._lock:
+            if self.size() > self.max_bytes:
+                os.replace(self.path, self.path.with_name(self.path.name + ".1"))
+            with open(self.path, "a", encoding="utf-8") as f:
+                if f.tell() == 0:
+                    line = json.dumps({"journal": uuid.uuid4().hex}) + "\n" + line
+                f.write(line)
+
+    def size(self) -> int:
+        try:
+            return self.path.stat().st_size
+        except FileNotFoundError:
+            return 0
+
+    def _file_id(self):
+        try:
+            with open(self.path, "rb") as f:
+                first = f.readline()
+        except FileNotFoundError:
+            return None
+        return json.loads(first)["journal"] if first.endswith(b"\n") else None
+
+    def seek_end(self):
+        """Start reading from the current end of the journal."""
+        self._reading, self._offset = self._file_id(), self.size()
+
+    def read_new(self):
+        """
+        Entries appended since the last read (or seek_end). Returns None if the
+        journal was rotated in between, since entries may have been missed.
+        """
+        file_id = self._file_id()
+        if file_id != self._reading:
+            rotated = self._reading is not None
+            self._reading, self._offset = file_id, 0
+            if rotated:
+                return None
+        size = self.size()
+        if file_id is None or size <= self._offset:
+            return []
+        with open(self.path, "rb") as f:
+            f.seek(self._offset)
+            chunk = f.read(size - self._offset)
+        # a line still being written is picked up next time
+        end = chunk.rfind(b"\n") + 1
+        self._offset += end
+        entries = [json.loads(line) for line in chunk[:end].splitlines() if line.strip()]
+        return [e for e in entries if "journal" not in e]
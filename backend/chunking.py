@@ -0,0 +1,75 @@
+import os
+import re
+
+# How build_db groups a post's sentences into embedded chunks. A strategy is
+# named by a short spec string, set per course with "chunking" in auth.json:
+#
+#   sentences       every sentence is its own chunk (the original behaviour)
+#   window:N[:S]    windows of N consecutive sentences, starting every S <= N sentences
+#                   (default 1, so neighbouring windows overlap by N - S)
+#   tokens:N        consecutive sentences packed greedily into chunks of at most
+#                   N tokens; a longer sentence becomes a chunk of its own
+#
+# The spec a course was indexed with is stored next to its index, and the
+# builder re-chunks every post when it changes.
+
+CHUNKING = os.environ.get("CHUNKING", "sentences")  # for courses without "chunking" in auth.json
+TOKEN_RE = re.compile(r"\w+|[^\w\s]")
+
+
+def count_tokens(text: str) -> int:
+    """
+    Words and punctuation marks. Deterministic and offline; slightly under
+    what OpenAI's tokenizer counts for English text.
+    """
+    return len(TOKEN_RE.findall(text))
+
+
+class Chunker:
+    def __init__(self, spec: str = None):
+        spec = (spec or CHUNKING).strip()
+        name, *args = spec.split(":")
+        try:
+            args = [int(a) for a in args]
+        except ValueError:
+            raise ValueError(f"Bad chunking spec {spec!r}: arguments must be integers") from None
+
+        if name == "sentences" and not args:
+            self.size = self.step = 1
+        elif name == "window" and len(args) in (1, 2) and all(a > 0 for a in args):
+            self.size, self.step = args[0], args[1] if len(args) == 2 else 1
+            if self.step > self.size:
+                raise ValueError(f"Bad chunking spec {spec!r}: a step larger than the window skips sentences")
+        elif name == "tokens" and len(args) == 1 and args[0] > 0:
+            self.max_tokens = args[0]
+        else:
+            raise ValueError(f"Unknown chunking spec {spec!r}; expected sentences, window:N[:S] or tokens:N")
+        self.name = name
+        # canonical form, so equivalent specs don't trigger a re-chunk
+        self.spec = f"window:{self.size}:{self.step}" if name == "window" else ":".join([name, *map(str, args)])
+
+    def chunk(self, sentences: list) -> list:
+        """Chunk texts for one post's sentences, in order."""
+        if self.name == "tokens":
+            return self._pack(sentences)
+        if len(sentences) <= self.size:
+            return [" ".join(sentences)] if sentences else []
+        chunks = [" ".join(sentences[i:i + self.size])
+                  for i in range(0, len(sentences) - self.size + 1, self.step)]
+        # a trailing partial window, so no sentence is left out
+        if (len(sentences) - self.size) % self.step:
+            chunks.append(" ".join(sentences[-self.size:]))
+        return chunks
+
+    def _pack(self, sentences: list) -> list:
+        chunks, current, used = [], [], 0
+        for sentence in sentences:
+            tokens = count_tokens(sentence)
+            if current and used + tokens > self.max_tokens:
+                chunks.append(" ".join(current))
+                current, used = [], 0
+            current.append(sentence)
+            used += tokens
+        if current:
+            chunks.append(" ".join(current))
+        return chunks
@@ -0,0 +1,130 @@
+import os
+import json
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+
+EMBEDDING_STORE_DIR = os.environ.get("EMBEDDING_STORE_DIR", "data/embeddings")
+EMBEDDING_STORE_DTYPE = os.environ.get("EMBEDDING_STORE_DTYPE", "float32")  # or float16 to halve the file
+
+DIGEST_SIZE = 20  # sha1
+
+
+def text_digest(text: str) -> bytes:
+    return hashlib.sha1(text.encode("utf-8")).digest()
+
+
+class EmbeddingStore:
+    """
+    Chunk embeddings for one model, keyed by the sha1 of the cleaned chunk
+    text and shared by every course. Rows are appended to two flat files:
+      vectors.bin  dtype[n_rows, dim], memory-mapped for reads
+      keys.bin     20-byte digests, row-aligned with vectors.bin
+    The digest -> row index is rebuilt from keys.bin on open.
+    """
+    def __init__(self, model: str, root=EMBEDDING_STORE_DIR, dtype: str = EMBEDDING_STORE_DTYPE):
+        self.dir = Path(root) / model
+        self.dir.mkdir(parents=True, exist_ok=True)
+        self.vectors_path = self.dir / "vectors.bin"
+        self.keys_path = self.dir / "keys.bin"
+        self.meta_path = self.dir / "meta.json"
+        self._lock = threading.Lock()
+
+        if self.meta_path.exists():
+            meta = json.loads(self.meta_path.read_text(encoding="utf-8"))
+            self.dim, self.dtype = meta["dim"], np.dtype(meta["dtype"])
+        else:
+            self.dim, self.dtype = None, np.dtype(dtype)
+
+        keys = self.keys_path.read_bytes() if self.keys_path.exists() else b""
+        n_rows = len(keys) // DIGEST_SIZE
+        if self.dim is not None and self.vectors_path.exists():
+            # a crash between the two appends leaves one file longer; trust the shorter
+            n_rows = min(n_rows, self.vectors_path.stat().st_size // (self.dim * self.dtype.itemsize))
+        self._index = {keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]: i for i in range(n_rows)}
+        self._truncate(n_rows)
+        self._vectors = None
+
+    @classmethod
+    def open_readonly(cls, model: str, root=EMBEDDING_STORE_DIR):
+        """
+        The store as it is now, for readers in another process than the
+        builder; None if it has no rows. Nothing is created or truncated, so
+        appends from build_db are never disturbed.
+        """
+        store = cls.__new__(cls)
+        store.dir = Path(root) / model
+        store.vectors_path = store.dir / "vectors.bin"
+        store.keys_path = store.dir / "keys.bin"
+        store.meta_path = store.dir / "meta.json"
+        store._lock = threading.Lock()
+        if not store.meta_path.exists() or not store.vectors_path.exists():
+            return None
+        meta = json.loads(store.meta_path.read_text(encoding="utf-8"))
+        store.dim, store.dtype = meta["dim"], np.dtype(meta["dtype"])
+        keys = store.keys_path.read_bytes() if store.keys_path.exists() else b""
+        n_rows = min(len(keys) // DIGEST_SIZE,
+                     store.vectors_path.stat().st_size // (store.dim * store.dtype.itemsize))
+        if not n_rows:
+            return None
+        store._index = {keys[i * DIGEST_SIZE:(i + 1) * DIGEST_SIZE]: i for i in range(n_rows)}
+        store._vectors = None
+        return store
+
+    def __len__(self):
+        return len(self._index)
+
+    def rows(self, texts: list) -> list:
+        """Row numbers in vectors() of each text's embedding; None where missing."""
+        with self._lock:
+            return [self._index.get(text_digest(t)) for t in texts]
+
+    def vectors(self) -> np.memmap:
+        """Every stored vector, memory-mapped, in the store's dtype."""
+        with self._lock:
+            return self._mapped()
+
+    def _truncate(self, n_rows: int):
+        if self.keys_path.exists():
+            os.truncate(self.keys_path, n_rows * DIGEST_SIZE)
+        if self.dim is not None and self.vectors_path.exists():
+            os.truncate(self.vectors_path, n_rows * self.dim * self.dtype.itemsize)
+
+    def _mapped(self):
+        # remap after appends so new rows become visible
+        if self._vectors is None or len(self._vectors) < len(self._index):
+            self._vectors = np.memmap(self.vectors_path, dtype=self.dtype, mode="r",
+                                      shape=(len(self._index), self.dim))
+        return self._vectors
+
+    def get_many(self, texts: list) -> list:
+        """Stored vectors (float32 arrays) aligned with texts; None where missing."""
+        with self._lock:
+            rows = [self._index.get(text_digest(t)) for t in texts]
+            if not any(r is not None for r in rows):
+                return [None] * len(texts)
+            vectors = self._mapped()
+            return [None if r is None else np.asarray(vectors[r], dtype=np.float32) for r in rows]
+
+    def put_many(self, texts: list, vectors: list):
+        with self._lock:
+            new = {}
+            for text, vector in zip(texts, vectors):
+                digest = text_digest(text)
+                if digest not in self._index:
+                    new[digest] = vector
+            if not new:
+                return
+            arr = np.asarray(list(new.values()), dtype=self.dtype)
+            if self.dim is None:
+                self.dim = arr.shape[1]
+                self.meta_path.write_text(json.dumps({"dim": self.dim, "dtype": self.dtype.name}),
+                                          encoding="utf-8")
+            # vectors first: a crash before the keys land just leaves unused rows
+            with open(self.vectors_path, "ab") as f:
+                f.write(arr.tobytes())
+            with open(self.keys_path, "ab") as f:
+                f.write(b"".join(new))
+            for digest in new:
+                self._index[digest] = len(self._index)
@@ -0,0 +1,86 @@
+import os
+import time
+import sqlite3
+import hashlib
+import threading
+from pathlib import Path
+
+MEDIA_CACHE_PATH = os.environ.get("MEDIA_CACHE_PATH", "data/media_cache.sqlite3")
+MEDIA_CACHE_MAX_ENTRIES = int(os.environ.get("MEDIA_CACHE_MAX_ENTRIES", "50000"))  # per table
+
+TABLES = ("redirects", "images", "captions")
+
+
+def caption_key(digest: str, model: str, prompt: str) -> str:
+    return hashlib.sha256(f"{digest}\0{model}\0{prompt}".encode("utf-8")).hexdigest()
+
+
+class MediaCache:
+    """
+    Persistent, course-independent cache for image captioning:
+      redirects  Piazza redirect url -> resolved CDN url
+      images     CDN url -> sha256 of the image bytes
+      captions   (image sha256, model, prompt) -> caption
+    Captions are content-addressed, so the same diagram pasted into many posts
+    or reposted in a later offering is captioned once. Each table keeps at most
+    max_entries rows, evicting the least recently used.
+    """
+    def __init__(self, path=MEDIA_CACHE_PATH, max_entries: int = MEDIA_CACHE_MAX_ENTRIES):
+        Path(path).parent.mkdir(parents=True, exist_ok=True)
+        self.max_entries = max_entries
+        self._db = sqlite3.connect(str(path), check_same_thread=False)
+        self._lock = threading.Lock()
+        for table in TABLES:
+            self._db.execute(
+                f"CREATE TABLE IF NOT EXISTS {table} (key TEXT PRIMARY KEY, value TEXT, last_used REAL)"
+            )
+            self._db.execute(f"CREATE INDEX IF NOT EXISTS {table}_lru ON {table} (last_used)")
+        self._db.commit()
+        self.reset_stats()
+
+    def get(self, table: str, key: str):
+        with self._lock:
+            row = self._db.execute(f"SELECT value FROM {table} WHERE key = ?", (key,)).fetchone()
+            if row is None:
+                self._misses[table] += 1
+                return None
+            self._hits[table] += 1
+            self._db.execute(f"UPDATE {table} SET last_used = ? WHERE key = ?", (time.time(), key))
+            self._db.commit()
+            return row[0]
+
+    def put(self, table: str, key: str, value: str):
+        with self._lock:
+            self._db.execute(
+                f"INSERT OR REPLACE INTO {table} VALUES (?, ?, ?)", (key, value, time.time())
+            )
+            (count,) = self._db.execute(f"SELECT COUNT(*) FROM {table}").fetchone()
+            if count > self.max_entries:
+                self._db.execute(
+                    f"DELETE FROM {table} WHERE key IN ("
+                    f" SELECT key FROM {table} ORDER BY last_used LIMIT ?)",
+                    (count - self.max_entries,),
+                )
+            self._db.commit()
+
+    def delete(self, table: str, key: str):
+        with self._lock:
+            self._db.execute(f"DELETE FROM {table} WHERE key = ?", (key,))
+            self._db.commit()
+
+    def stats(self) -> dict:
+        with self._lock:
+            out = {}
+            for table in TABLES:
+                lookups = self._hits[table] + self._misses[table]
+                out[table] = {
+                    "hits": self._hits[table],
+                    "misses": self._misses[table],
+                    "hit_rate": self._hits[table] / lookups if lookups else 0.0,
+                }
+            return out
+
+    def reset_stats(self):
+        with self._lock:
+            self._hits = {table: 0 for table in TABLES}
+            self._misses = {table: 0 for table in TABLES}
@@ -0,0 +1,190 @@
+import os
+import time
+import random
+import cProfile
+import threading
+from bisect import bisect_left
+from contextlib import contextmanager
+from pathlib import Path
+
+# default histogram buckets, in seconds: sub-millisecond BM25 up to slow embedding calls and rebuilds
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300)
+PROFILE_SLOW_MS = float(os.environ.get("PROFILE_SLOW_MS", "0"))  # 0 disables the slow-request profiler
+PROFILE_SAMPLE_RATE = float(os.environ.get("PROFILE_SAMPLE_RATE", "0.05"))  # share of requests profiled
+PROFILE_DIR = os.environ.get("PROFILE_DIR", "data/profiles")
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _number(value) -> str:
+    # repr keeps full precision (a format like :g rounds large counters)
+    return repr(value if isinstance(value, int) else float(value))
+
+
+def _labels(names, values, extra: str = "") -> str:
+    pairs = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+class Counter:
+    """Monotonic count per label set, e.g. engine cache hits per course."""
+    kind = "counter"
+
+    def __init__(self, name: str, help: str, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self._values = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with self._lock:
+            return [(self.name, _labels(self.label_names, key), value) for key, value in self._values.items()]
+
+
+class Histogram:
+    """Cumulative-bucket histogram per label set, in Prometheus' layout."""
+    kind = "histogram"
+
+    def __init__(self, name: str, help: str, labels=(), buckets=LATENCY_BUCKETS):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.buckets = tuple(buckets)
+        self._values = {}  # label values -> [per-bucket counts (last is +Inf), sum]
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(labels[n] for n in self.label_names)
+        with self._lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * (len(self.buckets) + 1), 0.0]
+            entry[0][bisect_left(self.buckets, value)] += 1
+            entry[1] += value
+
+    @contextmanager
+    def time(self, **labels):
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def samples(self):
+        out = []
+        with self._lock:
+            for key, (counts, total) in self._values.items():
+                running = 0
+                for bound, count in zip(self.buckets + ("+Inf",), counts):
+                    running += count
+                    out.append((self.name + "_bucket", _labels(self.label_names, key, f'le="{bound}"'), running))
+                out.append((self.name + "_sum", _labels(self.label_names, key), total))
+                out.append((self.name + "_count", _labels(self.label_names, key), running))
+        return out
+
+
+class Gauge:
+    """Point-in-time values read from fn when the registry is rendered; fn returns {label values: value}."""
+    kind = "gauge"
+
+    def __init__(self, name: str, help: str, fn, labels=()):
+        self.name, self.help, self.label_names = name, help, tuple(labels)
+        self.fn = fn
+
+    def samples(self):
+        return [(self.name, _labels(self.label_names, key if isinstance(key, tuple) else (key,)), value)
+                for key, value in self.fn().items()]
+
+
+class Registry:
+    """Named metrics rendered together in the Prometheus text exposition format."""
+    def __init__(self):
+        self._metrics = {}
+
+    def add(self, metric):
+        # re-registering a name (a module reloaded in a test script) replaces the old metric
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, help, labels=()) -> Counter:
+        return self.add(Counter(name, help, labels))
+
+    def histogram(self, name, help, labels=(), buckets=LATENCY_BUCKETS) -> Histogram:
+        return self.add(Histogram(name, help, labels, buckets))
+
+    def gauge(self, name, help, fn, labels=()) -> Gauge:
+        return self.add(Gauge(name, help, fn, labels))
+
+    def render(self) -> str:
+        lines = []
+        for metric in list(self._metrics.values()):
+            lines.append(f"# HELP {metric.name} {metric.help}")
+            lines.append(f"# TYPE {metric.name} {metric.kind}")
+            lines.extend(f"{name}{labels} {_number(value)}" for name, labels, value in metric.samples())
+        return "\n".join(lines) + "\n"
+
+    def write(self, path):
+        """Write render() to path atomically, for another process to serve (see api.py /api/metrics)."""
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp = path.with_suffix(".tmp")
+        tmp.write_text(self.render(), encoding="utf-8")
+        os.replace(tmp, path)
+
+
+REGISTRY = Registry()  # the process-wide registry
+
+
+def server_timing(timings: dict) -> str:
+    """A Server-Timing header value from {stage: seconds}."""
+    return ", ".join(f"{stage};dur={seconds * 1000:.2f}" for stage, seconds in timings.items())
+
+
+class SlowRequestProfiler:
+    """
+    Opt-in sampled profiler: start() profiles roughly sample_rate of the calls
+    and stop() dumps a cProfile file into out_dir when the call took longer
+    than slow_ms. Only one profile runs at a time, since cProfile can't nest.
+    Disabled when slow_ms is 0.
+    """
+    def __init__(self, slow_ms: float = PROFILE_SLOW_MS, sample_rate: float = PROFILE_SAMPLE_RATE,
+                 out_dir=PROFILE_DIR):
+        self.slow_ms = slow_ms
+        self.sample_rate = sample_rate
+        self.out_dir = Path(out_dir)
+        self._busy = threading.Lock()
+
+    def start(self):
+        """A handle for stop(), or None if this call is not being profiled."""
+        if self.slow_ms <= 0 or random.random() >= self.sample_rate:
+            return None
+        if not self._busy.acquire(blocking=False):
+            return None
+        profile = cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:  # another profiler is already active in this interpreter
+            self._busy.release()
+            return None
+        return profile, time.perf_counter()
+
+    def stop(self, handle, name: str):
+        """Finish a profile from start(); returns the dump path if the call was slow enough to keep."""
+        if handle is None:
+            return None
+        profile, start = handle
+        profile.disable()
+        self._busy.release()
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        if elapsed_ms < self.slow_ms:
+            return None
+        self.out_dir.mkdir(parents=True, exist_ok=True)
+        path = self.out_dir / f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{elapsed_ms:.0f}ms.prof"
+        profile.dump_stats(str(path))
+        return path
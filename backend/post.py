@@ -1,4 +1,17 @@
-from bs4 import BeautifulSoup  # to parse html
+from html.parser import HTMLParser  # streaming html tokenizer, also what BeautifulSoup's html.parser uses
+from html.entities import html5
+
+# tags whose text BeautifulSoup's get_text() leaves out, and tags it never keeps open
+SKIPPED_TEXT_TAGS = {"script", "style", "template", "rt", "rp"}
+VOID_TAGS = {
+    "area", "base", "basefont", "bgsound", "br", "col", "command", "embed", "frame", "hr", "image",
+    "img", "input", "isindex", "keygen", "link", "menuitem", "meta", "nextid", "param", "source",
+    "spacer", "track", "wbr",
+}
+# named entities as BeautifulSoup resolves them ("amp" and "amp;" alike)
+ENTITIES = {}
+for _name, _char in sorted(html5.items()):
+    ENTITIES.setdefault(_name[:-1] if _name.endswith(";") else _name, _char)
 
 class Post:
     # storing most important data as attributes, now including image info
@@ -21,6 +34,124 @@ class Post:
         self.image_urls = image_urls or []
 
 
+def _numeric_reference(name: str) -> str:
+    """Text for a numeric character reference, resolved the way BeautifulSoup does."""
+    base, digits = (16, "0123456789abcdefABCDEF") if name[:1] in "xX" else (10, "0123456789")
+    number = name[1:] if base == 16 else name
+    end = 0
+    while end < len(number) and number[end] in digits:
+        end += 1
+    if not end:
+        return name
+    code, extra = int(number[:end], base), number[end:]
+    if code == 0 or code > 0x10FFFF or 0xD800 <= code <= 0xDFFF:
+        char = "\ufffd"
+    elif 0x80 <= code <= 0x9F and code not in (0x81, 0x8D, 0x8F, 0x90, 0x9D):
+        char = bytes([code]).decode("cp1252")
+    else:
+        char = chr(code)
+    return char + extra
+
+
+class TextExtractor(HTMLParser):
+    """
+    One-pass equivalent of BeautifulSoup(html, 'html.parser') followed by
+    get_text(' ', strip=True) and collecting every <img src>. Text runs are
+    split wherever BeautifulSoup would start a new string (at tags, comments
+    and declarations), and runs inside script/style/template/rt/rp are dropped.
+    """
+    def __init__(self):
+        super().__init__(convert_charrefs=False)
+        self.strings = []
+        self.image_urls = []
+        self._data = []
+        self._open = []  # names of open tags
+        self._skipping = 0  # open tags from SKIPPED_TEXT_TAGS
+        self._closed_void = []  # void tags whose stray end tag is ignored
+
+    def _flush(self, keep=None):
+        if self._data:
+            text = "".join(self._data).strip()
+            self._data = []
+            if text and (keep if keep is not None else not self._skipping):
+                self.strings.append(text)
+
+    def _push(self, tag):
+        self._open.append(tag)
+        if tag in SKIPPED_TEXT_TAGS:
+            self._skipping += 1
+
+    def _pop_to(self, tag):
+        if tag not in self._open:
+            return
+        while self._open:
+            name = self._open.pop()
+            if name in SKIPPED_TEXT_TAGS:
+                self._skipping -= 1
+            if name == tag:
+                return
+
+    def handle_starttag(self, tag, attrs, self_closing=False):
+        self._flush()
+        if tag == "img":
+            src = dict(attrs).get("src")
+            if src:
+                self.image_urls.append(src)
+        self._push(tag)
+        if tag in VOID_TAGS and not self_closing:
+            self._flush()
+            self._pop_to(tag)
+            self._closed_void.append(tag)
+
+    def handle_startendtag(self, tag, attrs):
+        self.handle_starttag(tag, attrs, self_closing=True)
+        self._flush()
+        self._pop_to(tag)
+
+    def handle_endtag(self, tag):
+        if tag in self._closed_void:
+            self._closed_void.remove(tag)
+            return
+        self._flush()
+        self._pop_to(tag)
+
+    def handle_data(self, data):
+        self._data.append(data)
+
+    def handle_charref(self, name):
+        self._data.append(_numeric_reference(name))
+
+    def handle_entityref(self, name):
+        self._data.append(ENTITIES.get(name, "&" + name))
+
+    def _drop(self, data):
+        self._flush()
+        self._data.append(data)
+        self._flush(keep=False)
+
+    def unknown_decl(self, data):
+        if data.upper().startswith("CDATA["):
+            # CDATA is kept even inside skipped tags
+            self._flush()
+            self._data.append(data[len("CDATA["):])
+            self._flush(keep=True)
+        else:
+            self._drop(data)
+
+    handle_comment = handle_decl = handle_pi = _drop
+
+
+def extract_html(html: str):
+    """(text, image urls) of a Piazza html fragment."""
+    if "<" not in html and "&" not in html:
+        return html.strip(), []
+    parser = TextExtractor()
+    parser.feed(html)
+    parser.close()
+    parser._flush()
+    return " ".join(parser.strings), parser.image_urls
+
+
 def create_post_from_api(raw):
     """
     Build a Post object from the raw Piazza API response.
@@ -37,11 +168,8 @@ def create_post_from_api(raw):
     history = raw.get('history', [])
     initial_entry = history[0] if history else {}
     initial_html = initial_entry.get('content', '')
-    soup = BeautifulSoup(initial_html, 'html.parser')
-    img_tags = soup.find_all('img')
-    image_urls = [img['src'] for img in img_tags if img.get('src')]
+    content, image_urls = extract_html(initial_html)
     has_image = bool(image_urls)
-    content = soup.get_text(separator=' ', strip=True)
 
     # initialize answer fields
     instructor_answer = None
@@ -49,22 +177,29 @@ def create_post_from_api(raw):
 
     # traverse follow-up children for answers
     for child in raw.get('children', []):
+        # detect an instructor/professor answer
+        is_instructor_answer = child.get('type') == 'i_answer' and instructor_answer is None
+
+        # detect a student answer that has been endorsed by an instructor/professor
+        is_endorsed_answer = False
+        if child.get('type') in ('s_answer', 'followup') and endorsed_answer is None:
+            endorsements = child.get('tag_endorse', []) + child.get('tag_good', [])
+            is_endorsed_answer = any(e.get('role') in ('instructor', 'professor') for e in endorsements)
+
+        # only parse children that contribute an answer
+        if not (is_instructor_answer or is_endorsed_answer):
+            continue
+
         # use latest history entry for content
         ch_history = child.get('history', [])
         latest = ch_history[-1] if ch_history else {}
-        child_html = latest.get('content', '')
-        child_text = BeautifulSoup(child_html, 'html.parser').get_text(separator=' ', strip=True)
+        child_text, _ = extract_html(latest.get('content', ''))
 
-        # detect an instructor/professor answer
-        if child.get('type') == 'i_answer' and instructor_answer is None:
+        if is_instructor_answer:
             instructor_answer = child_text or None
             # continue to look for endorsed student answers
-
-        # detect a student answer that has been endorsed by an instructor/professor
-        if child.get('type') in ('s_answer', 'followup') and endorsed_answer is None:
-            endorsements = child.get('tag_endorse', []) + child.get('tag_good', [])
-            if any(e.get('role') in ('instructor', 'professor') for e in endorsements):
-                endorsed_answer = child_text or None
+        if is_endorsed_answer:
+            endorsed_answer = child_text or None
 
         # stop early if both answers found
         if instructor_answer is not None and endorsed_answer is not None:
@@ -0,0 +1,260 @@
+import json
+import sqlite3
+import threading
+from pathlib import Path
+from utils import post_hash, BUILDER_FIELDS
+
+
+class PostStore:
+    """
+    Per-course post storage in SQLite (WAL mode), shared by the scraper and
+    build_db without whole-file rewrites.
+
+      posts        one row per post: scraped fields as json, their content hash,
+                   and the sequence number of the last change (removals are
+                   kept as tombstones so readers see them in changed_since)
+      annotations  fields build_db adds (captions, full_text); writing them
+                   does not bump the post's sequence number
+      markers      the scraper's feed fingerprint (and creation time) per post,
+                   so unchanged posts are not fetched again
+      meta         small key/value state
+    """
+    def __init__(self, path: Path):
+        self.path = Path(path)
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        self._db = sqlite3.connect(str(self.path), timeout=30, check_same_thread=False,
+                                   isolation_level=None)
+        self._lock = threading.Lock()
+        self._db.execute("PRAGMA journal_mode=WAL")
+        self._db.execute("PRAGMA synchronous=NORMAL")
+        self._db.executescript("""
+            CREATE TABLE IF NOT EXISTS posts (
+                post_id TEXT PRIMARY KEY,
+                data TEXT NOT NULL,
+                hash TEXT NOT NULL,
+                seq INTEGER NOT NULL,
+                deleted INTEGER NOT NULL DEFAULT 0
+            );
+            CREATE INDEX IF NOT EXISTS posts_seq ON posts (seq);
+            CREATE TABLE IF NOT EXISTS annotations (post_id TEXT PRIMARY KEY, data TEXT NOT NULL);
+            CREATE TABLE IF NOT EXISTS markers (post_id TEXT PRIMARY KEY, marker TEXT NOT NULL, created TEXT);
+            CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+        """)
+
+    @classmethod
+    def for_course(cls, course_code: str):
+        return cls(Path("data") / course_code / "posts.sqlite3")
+
+    # --- reads ---
+
+    def count(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COUNT(*) FROM posts WHERE deleted = 0").fetchone()[0]
+
+    def max_seq(self) -> int:
+        with self._lock:
+            return self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM posts").fetchone()[0]
+
+    def get(self, post_id: str):
+        return self.get_many([post_id]).get(post_id)
+
+    def get_many(self, post_ids: list) -> dict:
+        """Live posts by id, with build_db annotations merged in."""
+        out = {}
+        with self._lock:
+            for i in range(0, len(post_ids), 500):
+                ids = list(post_ids[i:i + 500])
+                marks = ",".join("?" * len(ids))
+                rows = self._db.execute(
+                    f"SELECT p.post_id, p.data, a.data FROM posts p"
+                    f" LEFT JOIN annotations a ON a.post_id = p.post_id"
+                    f" WHERE p.deleted = 0 AND p.post_id IN ({marks})", ids
+                ).fetchall()
+                for pid, data, extra in rows:
+                    out[pid] = self._merge(data, extra)
+        # keep the caller's order
+        return {pid: out[pid] for pid in post_ids if pid in out}
+
+    def all(self) -> dict:
+        with self._lock:
+            rows = self._db.execute(
+                "SELECT p.post_id, p.data, a.data FROM posts p"
+                " LEFT JOIN annotations a ON a.post_id = p.post_id"
+                " WHERE p.deleted = 0 ORDER BY p.seq"
+            ).fetchall()
+        return {pid: self._merge(data, extra) for pid, data, extra in rows}
+
+    def hashes(self) -> dict:
+        with self._lock:
+            return dict(self._db.execute("SELECT post_id, hash FROM posts WHERE deleted = 0"))
+
+    def pinned_ids(self) -> set:
+        """Ids of live posts stored as pinned."""
+        with self._lock:
+            return {pid for (pid,) in self._db.execute(
+                "SELECT post_id FROM posts WHERE deleted = 0 AND json_extract(data, '$.is_pinned')")}
+
+    def changed_since(self, seq: int) -> list:
+        """(post_id, hash, deleted, seq) for every post changed after seq, oldest first."""
+        with self._lock:
+            return self._db.execute(
+                "SELECT post_id, hash, deleted, seq FROM posts WHERE seq > ? ORDER BY seq", (seq,)
+            ).fetchall()
+
+    def markers(self) -> dict:
+        """post_id -> (feed marker, created) as last recorded by the scraper."""
+        with self._lock:
+            return {pid: (marker, created) for pid, marker, created
+                    in self._db.execute("SELECT post_id, marker, created FROM markers")}
+
+    @staticmethod
+    def _merge(data, extra):
+        post = json.loads(data)
+        if extra:
+            post.update(json.loads(extra))
+        return post
+
+    # --- writes ---
+
+    def put_many(self, posts: dict) -> list:
+        """
+        Insert or update scraped posts; rows whose content hash is unchanged are
+        left alone. Returns the ids that were written.
+        """
+        written = []
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM posts").fetchone()[0]
+                for pid, post in posts.items():
+                    scraped = {k: v for k, v in post.items() if k not in BUILDER_FIELDS}
+                    digest = post_hash(scraped)
+                    row = self._db.execute(
+                        "SELECT hash, deleted FROM posts WHERE post_id = ?", (pid,)
+                    ).fetchone()
+                    if row is not None and row[0] == digest and not row[1]:
+                        continue
+                    seq += 1
+                    self._db.execute(
+                        "INSERT OR REPLACE INTO posts (post_id, data, hash, seq, deleted) VALUES (?, ?, ?, ?, 0)",
+                        (pid, json.dumps(scraped, ensure_ascii=False), digest, seq),
+                    )
+                    written.append(pid)
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return written
+
+    def delete_many(self, post_ids: list) -> list:
+        """
+        Tombstone posts that are gone from Piazza, so build_db drops them from
+        its indexes. Returns the ids that were live until now.
+        """
+        deleted = []
+        if not post_ids:
+            return deleted
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                seq = self._db.execute("SELECT COALESCE(MAX(seq), 0) FROM posts").fetchone()[0]
+                for pid in post_ids:
+                    cur = self._db.execute(
+                        "UPDATE posts SET deleted = 1, seq = ? WHERE post_id = ? AND deleted = 0", (seq + 1, pid)
+                    )
+                    if cur.rowcount:
+                        seq += 1
+                        deleted.append(pid)
+                for table in ("annotations", "markers"):
+                    self._db.execute(f"DELETE FROM {table} WHERE post_id IN (%s)" % ",".join("?" * len(post_ids)),
+                                     list(post_ids))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        return deleted
+
+    def set_annotations(self, annotations: dict):
+        """Replace build_db's fields for the given posts (post_id -> dict)."""
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                for pid, extra in annotations.items():
+                    if extra:
+                        self._db.execute("INSERT OR REPLACE INTO annotations VALUES (?, ?)",
+                                         (pid, json.dumps(extra, ensure_ascii=False)))
+                    else:
+                        self._db.execute("DELETE FROM annotations WHERE post_id = ?", (pid,))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def set_markers(self, markers: dict):
+        """Record post_id -> (feed marker, created); does not bump sequence numbers."""
+        if not markers:
+            return
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                self._db.executemany("INSERT OR REPLACE INTO markers VALUES (?, ?, ?)",
+                                     [(pid, marker, created) for pid, (marker, created) in markers.items()])
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+
+    def get_meta(self, key: str, default=None):
+        with self._lock:
+            row = self._db.execute("SELECT value FROM meta WHERE key = ?", (key,)).fetchone()
+        return json.loads(row[0]) if row else default
+
+    def set_meta(self, key: str, value):
+        with self._lock:
+            self._db.execute("INSERT OR REPLACE INTO meta VALUES (?, ?)", (key, json.dumps(value)))
+
+    # --- migration ---
+
+    def migrate_json(self, json_path: Path) -> bool:
+        """
+        One-shot import of a legacy posts.json into an empty store. The file is
+        renamed to posts.json.migrated afterwards so it is not imported twice.
+        """
+        json_path = Path(json_path)
+        if not json_path.exists() or self.max_seq() > 0:
+            return False
+        data = json.loads(json_path.read_text(encoding="utf-8"))
+        with self._lock:
+            self._db.execute("BEGIN IMMEDIATE")
+            try:
+                # another process may have migrated while we were reading
+                if self._db.execute("SELECT COUNT(*) FROM posts").fetchone()[0]:
+                    self._db.execute("ROLLBACK")
+                    return False
+                for seq, (pid, post) in enumerate(data.items(), start=1):
+                    scraped = {k: v for k, v in post.items() if k not in BUILDER_FIELDS}
+                    extra = {k: post[k] for k in BUILDER_FIELDS if k in post}
+                    self._db.execute(
+                        "INSERT INTO posts (post_id, data, hash, seq, deleted) VALUES (?, ?, ?, ?, 0)",
+                        (pid, json.dumps(scraped, ensure_ascii=False), post_hash(scraped), seq),
+                    )
+                    if extra:
+                        self._db.execute("INSERT INTO annotations VALUES (?, ?)",
+                                         (pid, json.dumps(extra, ensure_ascii=False)))
+                self._db.execute("COMMIT")
+            except BaseException:
+                self._db.execute("ROLLBACK")
+                raise
+        json_path.rename(json_path.with_name(json_path.name + ".migrated"))
+        return True
+
+
+if __name__ == "__main__":
+    # migrate every registered course's posts.json
+    auth_map = json.loads(Path("auth.json").read_text(encoding="utf-8"))
+    for course_code in auth_map:
+        store = PostStore.for_course(course_code)
+        if store.migrate_json(Path("data") / course_code / "posts.json"):
+            print(f"Migrated {course_code}: {store.count()} posts")
+        else:
+            print(f"Nothing to migrate for {course_code}")
@@ -0,0 +1,149 @@
+import os
+import time
+import sqlite3
+import threading
+from array import array
+from collections import OrderedDict
+from pathlib import Path
+
+QUERY_CACHE_SIZE = int(os.environ.get("QUERY_CACHE_SIZE", "2048"))  # in-memory entries
+QUERY_CACHE_PATH = os.environ.get("QUERY_CACHE_PATH", "data/query_cache.sqlite3")  # "" disables the disk tier
+QUERY_CACHE_DISK_MAX = int(os.environ.get("QUERY_CACHE_DISK_MAX", "100000"))  # on-disk entries
+
+
+def normalize_query(query: str) -> str:
+    return " ".join(query.casefold().split())
+
+
+class QueryEmbeddingCache:
+    """
+    Query embeddings keyed by (model name, normalized query text). A bounded
+    in-memory LRU sits in front of an optional SQLite file that survives API
+    restarts; only misses on both tiers reach the embeddings API.
+    """
+    def __init__(self, max_entries: int = QUERY_CACHE_SIZE, disk_path=QUERY_CACHE_PATH,
+                 disk_max_entries: int = QUERY_CACHE_DISK_MAX):
+        self.max_entries = max_entries
+        self.disk_max_entries = disk_max_entries
+        self._memory = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        self._db = None
+        if disk_path:
+            Path(disk_path).parent.mkdir(parents=True, exist_ok=True)
+            self._db = sqlite3.connect(str(disk_path), check_same_thread=False)
+            self._db.execute(
+                "CREATE TABLE IF NOT EXISTS query_embeddings ("
+                " model TEXT, query TEXT, vector BLOB, last_used REAL,"
+                " PRIMARY KEY (model, query))"
+            )
+            self._db.commit()
+
+    def embed_query(self, embedding_model, query: str) -> list:
+        """Return the embedding of query, calling embedding_model only on a miss."""
+        key = (embedding_model.model, normalize_query(query))
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+                self.hits += 1
+                return vector
+            vector = self._disk_get(key)
+            if vector is not None:
+                self.disk_hits += 1
+                self._remember(key, vector)
+                return vector
+            self.misses += 1
+
+        vector = embedding_model.embed_query(query)
+        with self._lock:
+            self._remember(key, vector)
+            self._disk_put(key, vector)
+        return vector
+
+    def embed_queries(self, embedding_model, queries: list) -> list:
+        """
+        Embeddings of many queries, in order. All misses go to embedding_model
+        in a single embed_documents request, each distinct query once.
+        """
+        keys = [(embedding_model.model, normalize_query(q)) for q in queries]
+        found, missing = {}, {}  # key -> vector, key -> query text to embed
+        with self._lock:
+            for key, query in zip(keys, queries):
+                if key in found or key in missing:
+                    continue
+                vector = self._memory.get(key)
+                if vector is not None:
+                    self._memory.move_to_end(key)
+                    self.hits += 1
+                    found[key] = vector
+                    continue
+                vector = self._disk_get(key)
+                if vector is not None:
+                    self.disk_hits += 1
+                    self._remember(key, vector)
+                    found[key] = vector
+                    continue
+                self.misses += 1
+                missing[key] = query
+
+        if missing:
+            vectors = embedding_model.embed_documents(list(missing.values()))
+            with self._lock:
+                for key, vector in zip(missing, vectors):
+                    found[key] = vector
+                    self._remember(key, vector)
+                    self._disk_put(key, vector)
+        return [found[key] for key in keys]
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.disk_hits + self.misses
+            return {
+                "hits": self.hits,
+                "disk_hits": self.disk_hits,
+                "misses": self.misses,
+                "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+                "entries": len(self._memory),
+            }
+
+    def _remember(self, key, vector):
+        self._memory[key] = vector
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key):
+        if self._db is None:
+            return None
+        row = self._db.execute(
+            "SELECT vector FROM query_embeddings WHERE model = ? AND query = ?", key
+        ).fetchone()
+        if row is None:
+            return None
+        self._db.execute(
+            "UPDATE query_embeddings SET last_used = ? WHERE model = ? AND query = ?",
+            (time.time(), *key),
+        )
+        self._db.commit()
+        return array("f", row[0]).tolist()
+
+    def _disk_put(self, key, vector):
+        if self._db is None:
+            return
+        self._db.execute(
+            "INSERT OR REPLACE INTO query_embeddings VALUES (?, ?, ?, ?)",
+            (*key, array("f", vector).tobytes(), time.time()),
+        )
+        # trim the least recently used tenth once the file is over its cap
+        (count,) = self._db.execute("SELECT COUNT(*) FROM query_embeddings").fetchone()
+        if count > self.disk_max_entries:
+            self._db.execute(
+                "DELETE FROM query_embeddings WHERE rowid IN ("
+                " SELECT rowid FROM query_embeddings ORDER BY last_used LIMIT ?)",
+                (count - self.disk_max_entries + self.disk_max_entries // 10,),
+            )
+        self._db.commit()
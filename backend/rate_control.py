@@ -0,0 +1,138 @@
+import os
+import time
+import threading
+import requests
+from contextlib import contextmanager
+
+SCRAPE_CONCURRENCY = int(os.environ.get("SCRAPE_CONCURRENCY", "3"))  # get_post calls in flight per account
+SCRAPE_MIN_RATE = float(os.environ.get("SCRAPE_MIN_RATE", "0.1"))  # calls per second, floor
+SCRAPE_MAX_RATE = float(os.environ.get("SCRAPE_MAX_RATE", "4.0"))  # calls per second, ceiling
+SCRAPE_SLOW_LATENCY = float(os.environ.get("SCRAPE_SLOW_LATENCY", "3.0"))  # seconds; slower responses back off
+RATE_STEP = 0.1  # calls per second added after each fast, successful call
+THROTTLE_FACTOR = 0.5  # rate multiplier after a 429 / server error
+SLOW_FACTOR = 0.8  # rate multiplier after a slow response
+
+
+def status_of(exc: Exception):
+    return getattr(getattr(exc, "response", None), "status_code", None)
+
+
+def is_throttle(exc: Exception) -> bool:
+    """Piazza asking us to slow down: 429s and server errors."""
+    status = status_of(exc)
+    if status is not None:
+        return status == 429 or status >= 500
+    return "too many requests" in str(exc).lower()
+
+
+def is_transient(exc: Exception) -> bool:
+    """Failures worth retrying after backing off."""
+    return is_throttle(exc) or isinstance(exc, (requests.ConnectionError, requests.Timeout,
+                                                ConnectionError, TimeoutError))
+
+
+def raise_for_throttle(response, *args, **kwargs):
+    """requests response hook: piazza_api only looks at the json body, so surface 429/5xx as HTTPError."""
+    if response.status_code == 429 or response.status_code >= 500:
+        response.raise_for_status()
+
+
+class AdaptiveRateLimiter:
+    """
+    Paces one account's API calls and bounds how many run at once. The rate
+    follows AIMD: every fast success adds RATE_STEP calls/sec, while a
+    throttled or failed call halves it (and a slow one trims it), at most
+    once per call interval so a burst of concurrent failures counts once.
+    A Retry-After from Piazza pauses every call on the account.
+    """
+    def __init__(self, rate: float, concurrency: int = SCRAPE_CONCURRENCY,
+                 min_rate: float = SCRAPE_MIN_RATE, max_rate: float = SCRAPE_MAX_RATE,
+                 slow_latency: float = SCRAPE_SLOW_LATENCY):
+        self.rate = rate
+        self.concurrency = concurrency
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.slow_latency = slow_latency
+        self._slots = threading.BoundedSemaphore(concurrency)
+        self._lock = threading.Lock()
+        self._next = 0.0
+        self._last_decrease = 0.0
+        self.in_flight = 0
+        self.calls = 0
+        self.throttled = 0
+        self.errors = 0
+        self.slow = 0
+
+    def wait(self):
+        """Block until the next call may start."""
+        with self._lock:
+            now = time.monotonic()
+            delay = self._next - now
+            self._next = max(now, self._next) + 1.0 / self.rate
+        if delay > 0:
+            time.sleep(delay)
+
+    @contextmanager
+    def slot(self):
+        """Hold one of the concurrent slots, paced by the current rate, and learn from the outcome."""
+        with self._slots:
+            self.wait()
+            with self._lock:
+                self.in_flight += 1
+            start = time.monotonic()
+            try:
+                yield
+            except Exception as e:
+                self._on_failure(e)
+                raise
+            else:
+                self._on_success(time.monotonic() - start)
+            finally:
+                with self._lock:
+                    self.in_flight -= 1
+
+    def call(self, fn, *args, **kwargs):
+        with self.slot():
+            return fn(*args, **kwargs)
+
+    def _on_success(self, latency: float):
+        with self._lock:
+            self.calls += 1
+            if latency > self.slow_latency:
+                self.slow += 1
+                self._decrease(SLOW_FACTOR)
+            else:
+                self.rate = min(self.max_rate, self.rate + RATE_STEP)
+
+    def _on_failure(self, exc: Exception):
+        with self._lock:
+            self.calls += 1
+            if is_throttle(exc):
+                self.throttled += 1
+            else:
+                self.errors += 1
+            if not is_transient(exc):
+                return
+            self._decrease(THROTTLE_FACTOR)
+            retry_after = getattr(getattr(exc, "response", None), "headers", {}).get("Retry-After")
+            if retry_after and retry_after.isdigit():
+                self._next = max(self._next, time.monotonic() + int(retry_after))
+
+    def _decrease(self, factor: float):
+        now = time.monotonic()
+        if now - self._last_decrease < 1.0 / self.rate:
+            return
+        self._last_decrease = now
+        self.rate = max(self.min_rate, self.rate * factor)
+        self._next = max(self._next, now + 1.0 / self.rate)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "rate": self.rate,
+                "in_flight": self.in_flight,
+                "calls": self.calls,
+                "throttled": self.throttled,
+                "errors": self.errors,
+                "slow": self.slow,
+            }
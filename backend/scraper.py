@@ -1,138 +1,320 @@
 import os
 import json
 import time
+import hashlib
+import threading
 from pathlib import Path
-import warnings
+from concurrent.futures import ThreadPoolExecutor
 from piazza_api import Piazza
-from bs4 import MarkupResemblesLocatorWarning
-from utils import save_stored_posts, load_stored_posts
+from piazza_api.exceptions import AuthenticationError, NotAuthenticatedError, RequestError
+from utils import post_hash
+from rate_control import AdaptiveRateLimiter, raise_for_throttle, is_transient
+from post_store import PostStore
+from change_journal import ChangeJournal
 from post import create_post_from_api
 from datetime import datetime, timezone, timedelta
 
-# suppress html parsing warnings
-warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
-
 # --- configuration ---
 AUTH_PATH = Path("auth.json")
 PIAZZA_DOMAIN = "https://piazza.com"
-RATE_LIMIT = 2.0 # seconds between API calls
+RATE_LIMIT = 2.0 # starting seconds between API calls, per account; adapts from there
+MAX_RETRIES = 5 # attempts after a throttled or failed call
+SCRAPE_BATCH = 100 # posts fetched and persisted per checkpoint
+CURSOR_KEY = "first_run_cursor" # store meta: progress of an unfinished first scrape
 SCRAPE_INTERVAL = 10 * 60 # seconds between runs
 REFRESH_WINDOW = timedelta(days=7) # how far back to refresh existing posts
+# feed summary fields that move when a post (or its answers/followups) changes
+MARKER_FIELDS = ("modified", "updated", "m", "main_version", "status", "no_answer", "no_answer_followup", "pin")
 
 # load credentials map
 if not AUTH_PATH.exists():
     print("auth.json not found.")
     exit(1)
 auth_map = json.loads(AUTH_PATH.read_text())
+journal = ChangeJournal()  # tells build_db which posts just changed
+
+
+def is_auth_error(exc: Exception) -> bool:
+    """Piazza reports an expired session as an ordinary error response."""
+    if isinstance(exc, (AuthenticationError, NotAuthenticatedError)):
+        return True
+    msg = str(exc).lower()
+    return isinstance(exc, RequestError) and ("log in" in msg or "logged in" in msg or "login" in msg)
 
 
-def process_course(course_code: str, creds: dict):
+class Account:
     """
-    Log into Piazza for course_code, scrape newest->oldest.
-    - First run: scrape ALL posts (including pinned).
-    - Subsequent runs: skip pinned; refresh anything created within REFRESH_WINDOW;
-      and stop early once we hit the first non-pinned post that is older than the window AND already stored.
+    One Piazza login, kept across scrape cycles and shared by every course
+    registered under the same email. Calls go through the account's adaptive
+    rate limiter; the session is only re-established when Piazza rejects it.
     """
-    # prepare storage
-    course_dir = Path("data") / course_code
-    course_dir.mkdir(parents=True, exist_ok=True)
-    storage_file = course_dir / "posts.json"
+    def __init__(self, email: str, password: str):
+        self.email = email
+        self.password = password
+        self.limiter = AdaptiveRateLimiter(1.0 / RATE_LIMIT)
+        self._piazza = None
+        self._networks = {}
+        self._generation = 0  # bumped on every login
+        self._lock = threading.Lock()
+
+    def _login(self):
+        piazza = Piazza()
+        piazza.user_login(email=self.email, password=self.password)
+        piazza._rpc_api.session.hooks["response"].append(raise_for_throttle)
+        self._piazza = piazza
+        self._networks = {}  # networks hold the old session
+        self._generation += 1
+        print(f"Logged in as {self.email}")
+
+    def relogin(self, generation: int):
+        """Log in again, unless another call already did since `generation` was rejected."""
+        with self._lock:
+            if generation == self._generation:
+                self._login()
+
+    def _network(self, course_code: str):
+        with self._lock:
+            if self._piazza is None:
+                self._login()
+            if course_code not in self._networks:
+                self._networks[course_code] = self._piazza.network(course_code)
+            return self._networks[course_code], self._generation
+
+    def call(self, course_code: str, method: str, *args, **kwargs):
+        """
+        Rate-limited Network call. Throttled and transient failures are retried
+        (the limiter has already slowed down); an expired session is
+        re-established once.
+        """
+        relogged = False
+        for attempt in range(MAX_RETRIES + 1):
+            network, generation = self._network(course_code)
+            try:
+                return self.limiter.call(getattr(network, method), *args, **kwargs)
+            except Exception as e:
+                if is_auth_error(e) and not relogged:
+                    print(f"Session for {self.email} rejected, logging in again")
+                    self.relogin(generation)
+                    relogged = True
+                elif attempt == MAX_RETRIES or not is_transient(e):
+                    raise
+
+
+def feed_marker(summary: dict) -> str:
+    """Fingerprint of a feed summary; a full fetch is only needed when it changes."""
+    fields = {k: summary[k] for k in MARKER_FIELDS if k in summary}
+    if not fields:
+        fields = summary  # unfamiliar feed format: any change at all triggers a fetch
+    return hashlib.sha1(json.dumps(fields, sort_keys=True, default=str).encode("utf-8")).hexdigest()
+
+
+def parse_time(value):
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except Exception:
+        return None
+
+
+accounts = {}  # email -> Account, reused across cycles
+
+
+def get_account(creds: dict) -> Account:
+    account = accounts.get(creds["email"])
+    if account is None or account.password != creds["password"]:
+        account = accounts[creds["email"]] = Account(creds["email"], creds["password"])
+    return account
+
+
+def build_snapshot(raw: dict, is_pinned: bool) -> dict:
+    """The stored fields of a fetched post."""
+    # build post object
+    post = create_post_from_api(raw)
 
-    # determine first-run BEFORE loading (load_stored_posts may create the file)
-    first_run = not storage_file.exists()
-    stored = load_stored_posts(storage_file)  # dict[str, snapshot]
+    # rewrite image urls to full cdn links
+    if post.has_image:
+        post.image_urls = [
+            PIAZZA_DOMAIN + url if isinstance(url, str) and url.startswith("/") else url
+            for url in post.image_urls
+        ]
 
-    new_posts = []
+    # snapshot of fields
+    snapshot = {
+        "subject": post.subject,
+        "content": post.content,
+        "has_instructor_answer": post.instructor_answer is not None,
+        "has_instructor_endorsement": post.endorsed_answer is not None,
+        "has_image": post.has_image,
+        "is_pinned": is_pinned,
+    }
+    if post.instructor_answer:
+        snapshot["instructor_answer"] = post.instructor_answer
+    if post.endorsed_answer:
+        snapshot["endorsed_answer"] = post.endorsed_answer
+    if post.has_image:
+        snapshot["image_urls"] = post.image_urls
+    return snapshot
 
-    # login
-    piazza = Piazza()
-    piazza.user_login(email=creds["email"], password=creds["password"])
-    network = piazza.network(course_code)
 
+def process_course(course_code: str, account: Account) -> tuple:
+    """
+    Scrape course_code newest->oldest with an already-created account.
+    - First run: scrape ALL posts (including pinned).
+    - Subsequent runs: skip pinned; only fetch posts whose feed marker moved since
+      the last scrape; and stop early once we hit the first non-pinned, unchanged
+      post that is older than REFRESH_WINDOW.
+    Posts are fetched up to the account's concurrency at a time and persisted
+    every SCRAPE_BATCH posts. An interrupted first run leaves a cursor in the
+    store and resumes from it: posts already saved are skipped by their markers.
+    Returns (fetched, skipped) post counts.
+    """
+    # prepare storage (imports a legacy posts.json the first time)
+    course_dir = Path("data") / course_code
+    store = PostStore.for_course(course_code)
+    store.migrate_json(course_dir / "posts.json")
+    cursor = store.get_meta(CURSOR_KEY)
+    first_run = store.count() == 0 or cursor is not None
+    if first_run and cursor is None:
+        # mark the run as unfinished before anything is saved
+        store.set_meta(CURSOR_KEY, {"last": None, "done": 0})
+    if cursor:
+        print(f"Resuming first scrape of {course_code} after post {cursor['last']} ({cursor['done']} posts saved)")
+    markers = store.markers()
+
+    skipped = 0
     cutoff = datetime.now(timezone.utc) - REFRESH_WINDOW
 
-    # iterate newest to oldest
-    for summary in network.iter_all_posts(limit=None, sleep=RATE_LIMIT):
+    # iterate by most recent activity; the feed has everything needed to decide whether to fetch a post
+    feed = account.call(course_code, "get_feed", limit=999999, offset=0)["feed"]
+
+    # the feed lists every post, so stored posts missing from it were deleted on Piazza
+    # (an empty feed is more likely a failed call than an emptied course)
+    live = set(store.hashes())
+    if feed:
+        feed_ids = {str(summary.get("nr")) for summary in feed}
+        removed = store.delete_many([pid for pid in live if pid not in feed_ids])
+        if removed:
+            live.difference_update(removed)
+            journal.append(course_code, removed)
+            print(f"{course_code}: {len(removed)} posts no longer on Piazza marked deleted")
+
+    # skipping is decided from ids and markers alone; stored posts are only loaded,
+    # a batch at a time, for the posts that are actually fetched
+    pinned = store.pinned_ids() if not first_run else set()
+    pending = []  # (post_id, cid, marker, known) to fetch, in feed order
+    for summary in feed:
         post_id = str(summary.get("nr"))
+        marker = feed_marker(summary)
+        known = markers.get(post_id)
 
-        # parse creation time from summary
-        created_str = summary.get("created")
-        created = None
-        if created_str:
-            try:
-                created = datetime.fromisoformat(created_str.replace("Z", "+00:00"))
-            except Exception:
-                created = None
+        if post_id in pinned:
+            continue
 
-        if not first_run and stored.get(post_id, {}).get("is_pinned", False):
+        # unchanged since the last scrape (or saved before an interruption): nothing to fetch
+        if post_id in live and known and known[0] == marker:
+            skipped += 1
+            created = parse_time(known[1])
+            if not first_run and created and created < cutoff:
+                # the feed is ordered by activity, so everything after this is unchanged too
+                print(f"stopping at post {post_id} in course {course_code} because it is older than 7 days")
+                break
             continue
+        pending.append((post_id, summary.get("id", post_id), marker, known))
+    del feed, markers
 
-        raw = network.get_post(post_id)
-        is_pinned = bool(raw.get("is_pinned", False))
+    fetched = 0
+    done = cursor["done"] if cursor else 0
+    stopped = False
+    with ThreadPoolExecutor(max_workers=account.limiter.concurrency) as pool:
+        for start in range(0, len(pending), SCRAPE_BATCH):
+            batch = pending[start:start + SCRAPE_BATCH]
+            stored_posts = store.get_many([post_id for post_id, *_ in batch])
+            # fetch concurrently, but handle results in feed order so stopping early still works
+            fetches = [pool.submit(account.call, course_code, "get_post", cid) for _, cid, *_ in batch]
+            updates = {}  # post_id -> snapshot, new or changed in this batch
+            seen = {}  # post_id -> (marker, created) for every post fetched in this batch
+            try:
+                for (post_id, cid, marker, known), fetch in zip(batch, fetches):
+                    raw = fetch.result()
+                    stored = stored_posts.get(post_id)
+                    is_pinned = bool(raw.get("is_pinned", False))
+                    created_str = raw.get("created")
+                    created = parse_time(created_str)
+                    seen[post_id] = (marker, created_str)
 
-        # on subsequent runs, skip pinned posts entirely
-        if not first_run and is_pinned:
-            if post_id in stored and not stored[post_id].get("is_pinned", False):
-                stored[post_id]["is_pinned"] = True
-                new_posts.append(create_post_from_api(raw))
-            continue
+                    # on subsequent runs, skip pinned posts entirely
+                    if not first_run and is_pinned:
+                        if stored and not stored.get("is_pinned", False):
+                            updates[post_id] = dict(stored, is_pinned=True)
+                        continue
 
-        if not first_run and created and created < cutoff and post_id in stored:
-            print(f"stopping at post {post_id} in course {course_code} because it is older than 7 days")
-            break
-
-        # build post object
-        post = create_post_from_api(raw)
-
-        # rewrite image urls to full cdn links
-        if post.has_image:
-            post.image_urls = [
-                PIAZZA_DOMAIN + url if isinstance(url, str) and url.startswith("/") else url
-                for url in post.image_urls
-            ]
-
-        # snapshot of fields
-        snapshot = {
-            "subject": post.subject,
-            "content": post.content,
-            "has_instructor_answer": post.instructor_answer is not None,
-            "has_instructor_endorsement": post.endorsed_answer is not None,
-            "has_image": post.has_image,
-            "is_pinned": is_pinned,
-        }
-        if post.instructor_answer:
-            snapshot["instructor_answer"] = post.instructor_answer
-        if post.endorsed_answer:
-            snapshot["endorsed_answer"] = post.endorsed_answer
-        if post.has_image:
-            snapshot["image_urls"] = post.image_urls
-
-        # record if new or changed
-        if post_id not in stored or stored[post_id] != snapshot:
-            stored[post_id] = snapshot
-            new_posts.append(post)
-
-    # persist only if there are new/updated posts
-    if new_posts:
-        new_ids = [str(p.number) for p in new_posts if hasattr(p, "number")]
-        reordered = {}
-        for pid in new_ids:
-            if pid in stored:
-                reordered[pid] = stored[pid]
-        for pid, snapshot in stored.items():
-            if pid not in reordered:
-                reordered[pid] = snapshot
-
-        save_stored_posts(reordered, storage_file)
+                    # posts stored before markers were recorded: keep the old stopping rule
+                    if not first_run and created and created < cutoff and stored and known is None:
+                        print(f"stopping at post {post_id} in course {course_code} because it is older than 7 days")
+                        stopped = True
+                        break
+
+                    snapshot = build_snapshot(raw, is_pinned)
+
+                    # record if new or changed (ignoring captions build_db added)
+                    if not stored or post_hash(stored) != post_hash(snapshot):
+                        updates[post_id] = snapshot
+            finally:
+                # drop fetches queued past an early stop (or a failure)
+                for fetch in fetches:
+                    fetch.cancel()
+
+            # checkpoint: the batch's posts, then the markers that vouch for them, then the cursor
+            if updates:
+                journal.append(course_code, store.put_many(updates))
+            store.set_markers(seen)
+            fetched += len(seen)
+            if first_run and seen:
+                done += len(seen)
+                store.set_meta(CURSOR_KEY, {"last": post_id, "done": done})
+            if stopped:
+                break
+
+    if first_run:
+        store.set_meta(CURSOR_KEY, None)
+    print(f"{course_code}: fetched {fetched} posts, skipped {skipped} unchanged")
+    return fetched, skipped
+
+
+def scrape_account(account: Account, course_codes: list) -> tuple:
+    """One worker: the account's courses in turn, so its rate limit is never shared."""
+    fetched = skipped = 0
+    for course_code in course_codes:
+        start = time.monotonic()
+        try:
+            f, s = process_course(course_code, account)
+            fetched, skipped = fetched + f, skipped + s
+            limits = account.limiter.stats()
+            print(f"Scraped {course_code} in {time.monotonic() - start:.1f}s"
+                  f" (rate {limits['rate']:.2f}/s, {limits['throttled']} throttled, {limits['errors']} errors)")
+        except Exception as e:
+            print(f"[ERROR] {course_code} after {time.monotonic() - start:.1f}s: {e}")
+    return fetched, skipped
+
+
+def scrape_all():
+    """Scrape every course, one worker per credential."""
+    by_account = {}
+    for course_code, creds in auth_map.items():
+        by_account.setdefault(get_account(creds), []).append(course_code)
+    with ThreadPoolExecutor(max_workers=len(by_account) or 1) as pool:
+        futures = [pool.submit(scrape_account, account, course_codes)
+                   for account, course_codes in by_account.items()]
+        counts = [f.result() for f in futures]
+    print(f"Fetched {sum(f for f, _ in counts)} posts, skipped {sum(s for _, s in counts)} unchanged")
 
 
 if __name__ == "__main__":
     while True:
-        for course_code, creds in auth_map.items():
-            try:
-                process_course(course_code, creds)
-            except Exception as e:
-                print(f"[ERROR] {course_code}: {e}")
+        start = time.monotonic()
+        scrape_all()
+        print(f"Scrape cycle finished in {time.monotonic() - start:.1f}s")
 
         print(f"Waiting {SCRAPE_INTERVAL} seconds until next update...")
         time.sleep(SCRAPE_INTERVAL)
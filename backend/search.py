@@ -23,7 +23,7 @@ query = input("Enter query: ").strip()
 prep_end = time.perf_counter()
 print(f"Query input received in {prep_end - prep_start:.2f} seconds.")
 
-results = search_top_k(course_code, query, k=10)
+results = search_top_k(course_code, query, k=10, backend=auth_map[course_code].get("vector_backend"))
 
 # print results in the same style as before
 print("Retrieval complete. Top 10 posts:")
@@ -1,65 +1,269 @@
-import json, re
+import os, time, threading
+from collections import OrderedDict
 from pathlib import Path
-from langchain_chroma import Chroma
-from langchain_openai import OpenAIEmbeddings
-from rank_bm25 import BM25Okapi
+from bm25_index import BM25Index, tokenize
+from query_cache import QueryEmbeddingCache
+from vector_index import open_vector_index
+from metrics import REGISTRY
 from dotenv import load_dotenv
 
 load_dotenv()  # uses OPENAI_API_KEY
 
-def search_top_k(course_code: str, query: str, k: int = 10):
+ENGINE_CACHE_MB = int(os.environ.get("ENGINE_CACHE_MB", "512"))  # memory budget for warm engines
+RELOAD_RETRY_SECONDS = 30  # wait before retrying a failed background reload
+EMBEDDING_MODEL = "text-embedding-3-large"
+
+SEARCH_STAGE_SECONDS = REGISTRY.histogram(
+    "piazzaplus_search_stage_seconds", "Time spent in each stage of a search.", ("course", "path", "stage"))
+SEARCH_QUERIES = REGISTRY.counter(
+    "piazzaplus_search_queries_total", "Queries answered, by single or batch search.", ("course", "path"))
+ENGINE_LOAD_SECONDS = REGISTRY.histogram(
+    "piazzaplus_engine_load_seconds", "Time to open a course's indexes into a CourseEngine.", ("course",))
+ENGINE_CACHE_LOOKUPS = REGISTRY.counter(
+    "piazzaplus_engine_cache_lookups_total", "EngineCache lookups by outcome (hit, miss, stale).", ("result",))
+ENGINE_CACHE_EVICTIONS = REGISTRY.counter(
+    "piazzaplus_engine_cache_evictions_total", "Engines dropped to stay within the memory budget.")
+
+
+def embedding_client():
+    """
+    The query embeddings client. langchain_openai takes seconds to import, so
+    it is imported on the first engine build rather than when the API starts.
+    """
+    from langchain_openai import OpenAIEmbeddings
+    return OpenAIEmbeddings(model=EMBEDDING_MODEL)
+
+
+def course_paths(course_code: str):
     base_dir = Path("data") / course_code
-    persist_dir = base_dir / "db"
-    json_path = base_dir / "posts.json"
-    if not persist_dir.exists() or not json_path.exists():
-        raise FileNotFoundError(
-            f"Missing vector DB or posts.json for {course_code}. "
-        )
-
-    embedding_model = OpenAIEmbeddings(model="text-embedding-3-large")
-    vector_database = Chroma(
-        persist_directory=str(persist_dir),
-        embedding_function=embedding_model,
-        collection_metadata={"hnsw:space": "cosine"},
-    )
-
-    # bm25 over whole-post text
-    with open(json_path, "r", encoding="utf-8") as f:
-        data = json.load(f)
-
-    post_texts = []
-    for p in data.values():
-        if "full_text" in p:
-            txt = p["full_text"]
+    return base_dir / "db", base_dir / "bm25.bin"
+
+
+def course_version(course_code: str) -> tuple:
+    """
+    Cheap version stamp for a course's on-disk index: a few stat() calls on
+    the files build_db rewrites at the end of every update.
+    """
+    persist_dir, bm25_path = course_paths(course_code)
+    stamp = []
+    for path in (bm25_path, persist_dir / "indexed_posts.json", persist_dir / "chroma.sqlite3"):
+        try:
+            st = path.stat()
+            stamp.append((st.st_mtime_ns, st.st_size))
+        except FileNotFoundError:
+            stamp.append(None)
+    return tuple(stamp)
+
+
+class CourseEngine:
+    """
+    Long-lived search state for one course: the embedding client, the vector
+    index (Chroma, or an in-memory numpy matrix, optionally quantized; see vector_index) and
+    the BM25 index over whole-post text. Built once and reused until the
+    course's files change on disk.
+    """
+    def __init__(self, course_code: str, query_cache: QueryEmbeddingCache = None, backend: str = None):
+        persist_dir, bm25_path = course_paths(course_code)
+        if not persist_dir.exists() or not bm25_path.exists():
+            raise FileNotFoundError(
+                f"Missing vector DB or keyword index for {course_code}. "
+            )
+        start = time.perf_counter()
+        self.course_code = course_code
+        self.query_cache = query_cache
+        self.version = course_version(course_code)
+
+        self.embedding_model = embedding_client()
+        # queries stay full length; the index cuts them to shortened vectors (build_db's
+        # vector_dim) for its first pass and rescores from the embedding store
+        self.vectors = open_vector_index(persist_dir, self.embedding_model, backend)
+
+        # bm25 over whole-post text, memory-mapped from the index build_db maintains
+        self.bm25 = BM25Index.load(bm25_path)
+        self.nbytes = self.bm25.nbytes + self.vectors.nbytes
+        ENGINE_LOAD_SECONDS.observe(time.perf_counter() - start, course=course_code)
+
+    def is_stale(self) -> bool:
+        return course_version(self.course_code) != self.version
+
+    def search(self, query: str, k: int = 10, timings: dict = None):
+        """Top k posts for query; if given, timings receives seconds spent per stage."""
+        start = time.perf_counter()
+        tokens = tokenize(query)
+        bm25_ids = self.bm25.get_top_n(tokens, n=100)
+        bm25_done = time.perf_counter()
+
+        # semantic stage over the BM25 candidates only, reusing cached query embeddings when available
+        if self.query_cache is not None:
+            vector = self.query_cache.embed_query(self.embedding_model, query)
+        else:
+            vector = self.embedding_model.embed_query(query)
+        embed_done = time.perf_counter()
+        results = self.vectors.search([vector], n=100, candidates=[bm25_ids])[0][:k]
+
+        self._record("single", 1, timings, bm25=bm25_done - start, embed=embed_done - bm25_done,
+                     vector=time.perf_counter() - embed_done)
+        return results
+
+    def search_batch(self, queries: list, k: int = 10, timings: dict = None) -> list:
+        """
+        search() for many queries at once: one embeddings request for the
+        uncached queries and one BM25 pass for all of them.
+        """
+        if not queries:
+            return []
+        start = time.perf_counter()
+        bm25_top = self.bm25.get_top_n_batch([tokenize(q) for q in queries], n=100)
+        bm25_done = time.perf_counter()
+
+        if self.query_cache is not None:
+            vectors = self.query_cache.embed_queries(self.embedding_model, queries)
         else:
-            txt = ' '.join(filter(None, [
-                p.get('subject',''),
-                p.get('content',''),
-                p.get('instructor_answer',''),
-                p.get('endorsed_answer',''),
-                ' '.join(p.get('captions', []))
-            ]))
-        post_texts.append(txt)
-
-    post_ids = list(data.keys())
-    tokenized_corpus = [re.findall(r"[A-Za-z]+|\d+", txt.lower()) for txt in post_texts]
-    bm25 = BM25Okapi(tokenized_corpus)
-
-    tokens = re.findall(r"[A-Za-z]+|\d+", query.lower())
-    bm25_ids = bm25.get_top_n(tokens, post_ids, n=100)
-    bm25_set = set(bm25_ids)
-
-    # semantic stage
-    results = vector_database.similarity_search_with_score(query, k=100)
-    results = [(d, dist) for d, dist in results if d.metadata["post_id"] in bm25_set]
-
-    scored = {}
-    for d, dist in results:
-        sim = 1.0 - dist
-        pid = d.metadata["post_id"]
-        subj = d.metadata["subject"]
-        scored.setdefault(pid, {"post_id": pid, "subject": subj, "score": sim})
-        scored[pid]["score"] = max(scored[pid]["score"], sim)
-
-    top = sorted(scored.values(), key=lambda x: x["score"], reverse=True)[:k]
-    return top
+            vectors = self.embedding_model.embed_documents(queries)
+        embed_done = time.perf_counter()
+        results = [posts[:k] for posts in self.vectors.search(vectors, n=100, candidates=bm25_top)]
+
+        self._record("batch", len(queries), timings, bm25=bm25_done - start, embed=embed_done - bm25_done,
+                     vector=time.perf_counter() - embed_done)
+        return results
+
+    def _record(self, path: str, n_queries: int, timings: dict, **stages):
+        for stage, seconds in stages.items():
+            SEARCH_STAGE_SECONDS.observe(seconds, course=self.course_code, path=path, stage=stage)
+        SEARCH_QUERIES.inc(n_queries, course=self.course_code, path=path)
+        if timings is not None:
+            timings.update(stages)
+
+
+class EngineCache:
+    """
+    Per-course CourseEngine objects kept warm across requests. Engines are
+    rebuilt when their course's files change and evicted least-recently-used
+    once the total estimated size exceeds max_bytes. All engines share one
+    query embedding cache.
+
+    With background_reload, a stale engine keeps answering while its
+    replacement is built on another thread and then swapped in, so a
+    rebuild never blocks or drops requests.
+
+    backends maps course codes to their vector backend name; courses not in
+    it use vector_index.VECTOR_BACKEND.
+    """
+    def __init__(self, max_bytes: int = ENGINE_CACHE_MB * 1024 * 1024,
+                 query_cache: QueryEmbeddingCache = None, background_reload: bool = False,
+                 backends: dict = None):
+        self.max_bytes = max_bytes
+        self.query_cache = query_cache
+        self.background_reload = background_reload
+        self.backends = backends or {}
+        self._engines = OrderedDict()  # course_code -> CourseEngine, oldest first
+        self._lock = threading.Lock()
+        self._build_locks = {}
+        self._reloading = set()
+        self._reload_failed = {}  # course_code -> time of the last failed background reload
+
+    def get(self, course_code: str) -> CourseEngine:
+        with self._lock:
+            engine = self._engines.get(course_code)
+            if engine is not None and (not engine.is_stale() or self.background_reload):
+                if self.background_reload and engine.is_stale():
+                    ENGINE_CACHE_LOOKUPS.inc(result="stale")
+                    self._reload_async(course_code)
+                else:
+                    ENGINE_CACHE_LOOKUPS.inc(result="hit")
+                self._engines.move_to_end(course_code)
+                return engine
+            ENGINE_CACHE_LOOKUPS.inc(result="miss")
+            build_lock = self._build_locks.setdefault(course_code, threading.Lock())
+
+        # build outside the cache lock so other courses keep serving
+        with build_lock:
+            with self._lock:
+                engine = self._engines.get(course_code)
+                if engine is not None and not engine.is_stale():
+                    self._engines.move_to_end(course_code)
+                    return engine
+            engine = CourseEngine(course_code, self.query_cache, self.backends.get(course_code))
+            with self._lock:
+                self._engines[course_code] = engine
+                self._engines.move_to_end(course_code)
+                self._evict()
+            return engine
+
+    def warm(self, course_codes) -> dict:
+        """Build engines for course_codes up front; returns each course's status."""
+        status = {}
+        for course_code in course_codes:
+            try:
+                self.get(course_code)
+                status[course_code] = "ready"
+            except FileNotFoundError:
+                status[course_code] = "not built"
+            except Exception as e:
+                status[course_code] = f"error: {e!r}"
+        return status
+
+    def refresh_stale(self):
+        """Start background rebuilds for every warm engine whose files changed."""
+        with self._lock:
+            for course_code, engine in self._engines.items():
+                if engine.is_stale():
+                    self._reload_async(course_code)
+
+    def _reload_async(self, course_code: str):
+        # caller holds self._lock
+        if course_code in self._reloading:
+            return
+        if time.monotonic() - self._reload_failed.get(course_code, float("-inf")) < RELOAD_RETRY_SECONDS:
+            return
+        self._reloading.add(course_code)
+        threading.Thread(target=self._reload, args=(course_code,), daemon=True).start()
+
+    def _reload(self, course_code: str):
+        try:
+            engine = CourseEngine(course_code, self.query_cache, self.backends.get(course_code))
+            with self._lock:
+                # in-flight requests finish on the engine they already hold
+                if course_code in self._engines:
+                    self._engines[course_code] = engine
+                    self._evict()
+                self._reload_failed.pop(course_code, None)
+        except Exception as e:
+            print(f"[ERROR] reloading {course_code}: {e!r}")
+            with self._lock:
+                self._reload_failed[course_code] = time.monotonic()
+        finally:
+            with self._lock:
+                self._reloading.discard(course_code)
+
+    def _evict(self):
+        # always keep the most recently used engine, even if it alone is over budget;
+        # an evicted engine's indexes are freed once requests still holding it finish
+        total = sum(e.nbytes for e in self._engines.values())
+        while total > self.max_bytes and len(self._engines) > 1:
+            _, evicted = self._engines.popitem(last=False)
+            total -= evicted.nbytes
+            ENGINE_CACHE_EVICTIONS.inc()
+
+    def sizes(self) -> dict:
+        """Estimated bytes of each warm engine's indexes, {(course, index): bytes}."""
+        with self._lock:
+            engines = list(self._engines.items())
+        sizes = {}
+        for course_code, engine in engines:
+            sizes[(course_code, "bm25")] = engine.bm25.nbytes
+            sizes[(course_code, "vectors")] = engine.vectors.nbytes
+        return sizes
+
+
+def search_top_k(course_code: str, query: str, k: int = 10, backend: str = None, timings: dict = None):
+    """One-off search that opens the course's indexes first; timings also gets a "load" stage."""
+    start = time.perf_counter()
+    engine = CourseEngine(course_code, backend=backend)
+    if timings is not None:
+        timings["load"] = time.perf_counter() - start
+    return engine.search(query, k, timings)
+
+
+def search_batch(course_code: str, queries: list, k: int = 10, backend: str = None) -> list:
+    return CourseEngine(course_code, backend=backend).search_batch(queries, k)
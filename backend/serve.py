@@ -0,0 +1,26 @@
+import os
+import time
+import threading
+from waitress import serve
+from api import app, engines, warm_up
+
+# --- configuration ---
+SERVE_HOST = os.environ.get("SERVE_HOST", "0.0.0.0")
+SERVE_PORT = int(os.environ.get("SERVE_PORT", "5000"))
+SERVE_THREADS = int(os.environ.get("SERVE_THREADS", "16"))  # requests handled at once
+RELOAD_INTERVAL = int(os.environ.get("RELOAD_INTERVAL", "10"))  # seconds between index change checks
+
+
+def watch_indexes():
+    """Swap in rebuilt engines as build_db updates courses, before a request has to notice."""
+    while True:
+        time.sleep(RELOAD_INTERVAL)
+        engines.refresh_stale()
+
+
+if __name__ == "__main__":
+    # answer /api/health right away; /api/ready turns 200 once every course is loaded
+    threading.Thread(target=warm_up, daemon=True).start()
+    threading.Thread(target=watch_indexes, daemon=True).start()
+    print(f"Serving on {SERVE_HOST}:{SERVE_PORT} with {SERVE_THREADS} threads")
+    serve(app, host=SERVE_HOST, port=SERVE_PORT, threads=SERVE_THREADS)
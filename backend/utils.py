@@ -1,25 +1,42 @@
 import json
 import re
 import hashlib
-from pathlib import Path
-from langchain_text_splitters import NLTKTextSplitter
-import requests
-import nltk
+import threading
+
+PUNKT_RESOURCE = "tokenizers/punkt_tab"  # sentence tokenizer data; found via NLTK_DATA or nltk's default paths
+
+
+def ensure_punkt():
+    """Download the NLTK sentence tokenizer data only if it is not installed yet."""
+    import nltk
+    try:
+        nltk.data.find(PUNKT_RESOURCE)
+    except LookupError:
+        nltk.download('punkt_tab', quiet=True)
+
+
+class SentenceSplitter:
+    """
+    The langchain NLTK sentence splitter, built on first use. Importing utils
+    stays cheap and offline; nltk and langchain load only in processes that
+    actually chunk posts.
+    """
+    def __init__(self):
+        self._splitter = None
+        self._lock = threading.Lock()
+
+    def split_text(self, text: str) -> list:
+        if self._splitter is None:
+            with self._lock:
+                if self._splitter is None:
+                    from langchain_text_splitters import NLTKTextSplitter
+                    ensure_punkt()
+                    self._splitter = NLTKTextSplitter(chunk_size=1, chunk_overlap=0)
+        return self._splitter.split_text(text)
+
 
 # setup langchain sentence splitter
-nltk.download('punkt_tab', quiet=True)
-splitter = NLTKTextSplitter(chunk_size=1, chunk_overlap=0)
-
-# compute hash of a file to detect changes
-def sha1_of_file(path: str) -> str:
-    h = hashlib.sha1()
-    with open(path, 'rb') as f:
-        while True:
-            chunk = f.read(8192)
-            if not chunk:
-                break
-            h.update(chunk)
-    return h.hexdigest()
+splitter = SentenceSplitter()
 
 # text cleaner
 def clean_text(text: str) -> str:
@@ -27,21 +44,37 @@ def clean_text(text: str) -> str:
     text = re.sub(r'\[([^\]]+)\]\([^\)]+\)', r'\1', text)
     return text.replace('`', '')
 
-# load posts from json
-def load_stored_posts(path: Path) -> dict:
-    if path.exists():
-        with open(path, 'r', encoding='utf-8') as f:
-            return json.load(f)
-    return {}
+# whole-post text used for keyword search
+def post_text(post: dict) -> str:
+    if "full_text" in post:
+        return post["full_text"]
+    return ' '.join(filter(None, [
+        post.get('subject',''),
+        post.get('content',''),
+        post.get('instructor_answer',''),
+        post.get('endorsed_answer',''),
+        ' '.join(post.get('captions', []))
+    ]))
+
+# fields build_db adds to a post; not part of its scraped content
+BUILDER_FIELDS = ("captions", "full_text")
+
+# content hash of a post as scraped, used to detect edits
+def post_hash(post: dict) -> str:
+    scraped = {k: v for k, v in post.items() if k not in BUILDER_FIELDS}
+    return hashlib.sha1(json.dumps(scraped, sort_keys=True).encode('utf-8')).hexdigest()
+
+# pooled connections for redirect lookups, opened on first use
+_session = None
 
 # convert piazza image link to the redirect link by following http redirect
 def to_cdn_url(redirect_url: str) -> str:
-    resp = requests.get(redirect_url, allow_redirects=False)
+    global _session
+    if _session is None:
+        import requests
+        _session = requests.Session()
+    resp = _session.get(redirect_url, allow_redirects=False, timeout=10)
     if resp.is_redirect or resp.status_code in (301, 302, 303, 307, 308):
         return resp.headers.get('Location')
     resp.raise_for_status()
     return redirect_url
-
-def save_stored_posts(data: dict, path: Path) -> None:
-    with open(path, 'w', encoding='utf-8') as f:
-        json.dump(data, f, indent=2)
\ No newline at end of file
@@ -0,0 +1,387 @@
+import os
+import json
+import weakref
+import threading
+import numpy as np
+from functools import partial
+from pathlib import Path
+from embedding_store import EmbeddingStore
+
+VECTOR_BACKEND = os.environ.get("VECTOR_BACKEND", "chroma")  # for courses without "vector_backend" in auth.json
+# float32, float16 to halve the numpy matrix, or int8 / binary to quantize it (see NumpyVectorIndex)
+VECTOR_INDEX_DTYPE = os.environ.get("VECTOR_INDEX_DTYPE", "float32")
+VECTOR_RESCORE_FACTOR = int(os.environ.get("VECTOR_RESCORE_FACTOR", "4"))  # quantized: n * this chunks rescored
+LOAD_PAGE = 5000  # chunks read from chroma at a time when loading the numpy matrix
+STALE_QUERY_CHUNKS = 1000  # chroma: nearest chunks searched when a candidate filter can't be applied
+SCAN_BLOCK = 8192  # float16 rows widened to float32 at a time while scanning
+QUANTIZED = ("int8", "binary")
+POPCOUNT = np.array([bin(i).count("1") for i in range(256)], dtype=np.uint8)
+popcount = getattr(np, "bitwise_count", lambda a: POPCOUNT[a])  # numpy >= 2.0 has a native one
+
+INDEX_CONFIG_FILE = "index_config.json"  # in a course's db folder, written by build_db
+CHROMA_OPEN_LOCK = threading.Lock()  # chromadb's client cache is process-wide
+
+
+def index_config(persist_dir) -> dict:
+    """
+    How a course's vectors were built: its chunking strategy and vector_dim
+    (None for full-length embeddings). Indexes from before the file existed
+    were chunked per sentence at full length.
+    """
+    path = Path(persist_dir) / INDEX_CONFIG_FILE
+    if path.exists():
+        return json.loads(path.read_text(encoding="utf-8"))
+    return {"chunking": "sentences", "vector_dim": None}
+
+
+def truncate_vectors(vectors, dim: int = None) -> np.ndarray:
+    """
+    Matryoshka-style shortening: keep the first dim components and rescale to
+    unit length, as the embeddings API does for a dimensions parameter.
+    """
+    vectors = np.asarray(vectors, dtype=np.float32)
+    if dim is None or dim >= vectors.shape[-1]:
+        return vectors
+    vectors = vectors[..., :dim]
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    return vectors / np.where(norms == 0, 1, norms)
+
+
+def best_per_post(post_ids, subjects, sims) -> list:
+    """Highest similarity per post among chunk hits, best first."""
+    scored = {}
+    for pid, subj, sim in zip(post_ids, subjects, sims):
+        if pid not in scored or sim > scored[pid]["score"]:
+            scored[pid] = {"post_id": pid, "subject": subj, "score": float(sim)}
+    return sorted(scored.values(), key=lambda x: x["score"], reverse=True)
+
+
+def full_similarities(full, rows, vector) -> np.ndarray:
+    """
+    Cosine similarity of vector to full[rows], at full[rows]' width; rows are
+    read in ascending order, which suits a memory-mapped embedding store.
+    """
+    rows = np.asarray(rows, dtype=np.int64)
+    order = np.argsort(rows)
+    vectors = np.empty((len(rows), full.shape[1]), dtype=np.float32)
+    vectors[order] = np.asarray(full[rows[order]], dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    vectors /= np.where(norms == 0, 1, norms)
+    q = np.asarray(vector, dtype=np.float32).reshape(-1)[:full.shape[1]]
+    return vectors @ (q / (np.linalg.norm(q) or 1))
+
+
+class ChromaVectorIndex:
+    """
+    Approximate (HNSW) search through the course's Chroma collection.
+
+    chromadb keeps one client system per path for the life of the process, and
+    a system's vector segment never sees chunks another process (build_db)
+    added after it was loaded. Each index therefore opens its own system and
+    keeps it out of that cache: a rebuilt engine reads the collection as it is
+    on disk, and the system (with its HNSW index) is stopped once the index is
+    dropped, i.e. when its engine is replaced or evicted and in-flight
+    requests on it have finished.
+
+    Queries are full-length embeddings. When the collection holds shortened
+    vectors (build_db's vector_dim), it is searched with the query cut to
+    match, and the n * VECTOR_RESCORE_FACTOR nearest chunks are rescored at
+    full length from the memory-mapped embedding store.
+    """
+    INCLUDE = ["metadatas", "distances"]  # what a query returns besides chunk ids
+
+    def __init__(self, persist_dir, embedding_model):
+        # heavy; imported when the first course is opened
+        import chromadb
+        from chromadb.api.shared_system_client import SharedSystemClient
+        from langchain_chroma import Chroma
+        with CHROMA_OPEN_LOCK:
+            SharedSystemClient.clear_system_cache()
+            client = chromadb.PersistentClient(path=str(persist_dir))
+            # open clients hold their system directly; the cache only needs it while one is created
+            system = client._system
+            SharedSystemClient.clear_system_cache()
+        self.db = Chroma(
+            client=client,
+            embedding_function=embedding_model,
+            collection_metadata={"hnsw:space": "cosine"},
+        )
+        # stopped with the last reference to the collection, which is what callers hold on to;
+        # the system's objects reference each other, so only the cyclic gc would free it otherwise
+        weakref.finalize(self.db._collection, system.stop)
+        # the float32 vectors chroma loads into its HNSW index on the first query
+        count = self.db._collection.count()
+        first = self.db._collection.get(limit=1, include=["embeddings"])["embeddings"] if count else []
+        self.nbytes = count * len(first[0]) * 4 if len(first) else 0
+
+        # shortened vectors: chunk id -> embedding store row, for every chunk the store has
+        self.vector_dim = index_config(persist_dir).get("vector_dim")
+        self.full, self.full_rows = None, {}
+        store = None
+        if self.vector_dim and embedding_model is not None:
+            store = EmbeddingStore.open_readonly(embedding_model.model)
+        if store is not None:
+            for offset in range(0, count, LOAD_PAGE):
+                page = self.db._collection.get(include=["documents"], limit=LOAD_PAGE, offset=offset)
+                self.full_rows.update((chunk_id, row) for chunk_id, row in
+                                      zip(page["ids"], store.rows(page["documents"])) if row is not None)
+            self.full = store.vectors()
+
+    def search(self, vectors: list, n: int = 100, candidates: list = None) -> list:
+        """
+        Per query, the best similarity of each post among its n nearest chunks.
+        candidates, one list of post ids per query, restricts each query to
+        those posts' chunks.
+        """
+        queries = vectors
+        vectors = truncate_vectors(queries, self.vector_dim).tolist()
+        fetch = n * VECTOR_RESCORE_FACTOR if self.full is not None else n
+        if candidates is None:
+            found = self.db._collection.query(query_embeddings=vectors, n_results=fetch, include=self.INCLUDE)
+            return [self._posts(self._hits(found, i), query, n) for i, query in enumerate(queries)]
+        from chromadb.errors import InternalError
+        # a where clause applies to every query in a call, so each gets its own
+        results = []
+        for vector, query, post_ids in zip(vectors, queries, candidates):
+            if not post_ids:
+                results.append([])
+                continue
+            try:
+                found = self.db._collection.query(query_embeddings=[vector], n_results=fetch,
+                                                  include=self.INCLUDE,
+                                                  where={"post_id": {"$in": list(post_ids)}})
+                hits = self._hits(found, 0)
+            except InternalError:
+                # some candidate's chunks were added after this index loaded its HNSW segment (its
+                # engine is reloaded shortly): search unfiltered and keep the candidates' chunks,
+                # which drops the posts the segment doesn't have yet
+                found = self.db._collection.query(query_embeddings=[vector], include=self.INCLUDE,
+                                                  n_results=max(fetch, STALE_QUERY_CHUNKS))
+                keep = set(post_ids)
+                hits = [hit for hit in self._hits(found, 0) if hit[1]["post_id"] in keep][:fetch]
+            results.append(self._posts(hits, query, n))
+        return results
+
+    @staticmethod
+    def _hits(found, i: int) -> list:
+        """(chunk id, metadata, similarity) of query i's chunks, nearest first."""
+        # chunks deleted since the HNSW segment was loaded come back without metadata
+        return [(chunk_id, meta, 1.0 - dist) for chunk_id, meta, dist
+                in zip(found["ids"][i], found["metadatas"][i], found["distances"][i]) if meta is not None]
+
+    def _posts(self, hits, query, n: int) -> list:
+        sims = [sim for _, _, sim in hits]
+        if self.full is not None:
+            # rescore at full length; chunks the store lacks keep their shortened similarity
+            have = [i for i, (chunk_id, _, _) in enumerate(hits) if chunk_id in self.full_rows]
+            rows = [self.full_rows[hits[i][0]] for i in have]
+            for i, sim in zip(have, full_similarities(self.full, rows, query).tolist()):
+                sims[i] = sim
+            best = sorted(range(len(hits)), key=lambda i: -sims[i])[:n]
+            hits, sims = [hits[i] for i in best], [sims[i] for i in best]
+        return best_per_post([meta["post_id"] for _, meta, _ in hits], [meta["subject"] for _, meta, _ in hits],
+                             sims)
+
+
+class NumpyVectorIndex:
+    """
+    Exact cosine search over every chunk of a course, held in memory:
+      matrix    dtype[n_chunks, dim]  unit-length chunk embeddings, grouped by post
+      post_of   int32[n_chunks]       row -> post number
+      row_start int64[n_posts + 1]    post number -> its first row
+      post_ids, subjects               post number -> post id / subject
+    Queries are one matrix product against it, then per query an
+    argpartition for the n best chunks and a group-by over their post numbers.
+    Queries restricted to candidate posts only scan those posts' rows.
+
+    With dtype int8 (a per-row scale, 4x smaller) or binary (sign bits, 32x
+    smaller) the matrix is a compact first pass: the n * VECTOR_RESCORE_FACTOR
+    best chunks by it are rescored at full precision. int8 saves memory only;
+    it scans slower than float32, which has a BLAS product. Full vectors are read
+    from the memory-mapped embedding store when it has every chunk, so only
+    rescored rows are paged in; otherwise a float32 copy is kept in memory.
+
+    Queries are full-length embeddings, cut to the matrix's width for the
+    scan. Shortened vectors (build_db's vector_dim) are rescored the same way
+    from the store, at full length, whatever the dtype.
+    """
+    def __init__(self, persist_dir, embedding_model, dtype: str = VECTOR_INDEX_DTYPE):
+        # the chroma index is only read from; its own rescoring setup is skipped
+        collection = ChromaVectorIndex(persist_dir, None).db._collection
+        rescored = dtype in QUANTIZED or index_config(persist_dir).get("vector_dim")
+        include = ["embeddings", "metadatas"] + (["documents"] if rescored else [])
+        vectors, metas, texts = [], [], []
+        for offset in range(0, collection.count(), LOAD_PAGE):
+            page = collection.get(include=include, limit=LOAD_PAGE, offset=offset)
+            vectors.append(np.asarray(page["embeddings"], dtype=np.float32))
+            metas.extend(page["metadatas"])
+            texts.extend(page.get("documents") or [])
+        vectors = np.concatenate(vectors) if vectors else np.zeros((0, 0), dtype=np.float32)
+
+        full = full_rows = None
+        if rescored and embedding_model is not None:
+            store = EmbeddingStore.open_readonly(embedding_model.model)
+            rows = store.rows(texts) if store is not None else [None]
+            if None not in rows:
+                full, full_rows = store.vectors(), np.asarray(rows, dtype=np.int64)
+        self._build(vectors, [m["post_id"] for m in metas], [m["subject"] for m in metas], dtype,
+                    full, full_rows)
+
+    @classmethod
+    def from_arrays(cls, vectors, post_ids: list, subjects: list, dtype: str = VECTOR_INDEX_DTYPE,
+                    full=None, full_rows=None):
+        """
+        Index chunk vectors given directly, one post id and subject per row.
+        With full, searches rescore row i from full[full_rows[i]]; quantized
+        indexes otherwise rescore from a float32 copy of vectors.
+        """
+        index = cls.__new__(cls)
+        index._build(np.asarray(vectors, dtype=np.float32), post_ids, subjects, dtype, full, full_rows)
+        return index
+
+    def _build(self, vectors, chunk_post_ids, chunk_subjects, dtype, full=None, full_rows=None):
+        self.post_ids, codes = np.unique(np.asarray(chunk_post_ids, dtype=object), return_inverse=True)
+        self.post_ids = self.post_ids.tolist()
+        # group rows by post so a post's chunks are one contiguous slice
+        order = np.argsort(codes, kind="stable")
+        self.post_of = codes[order].astype(np.int32)
+        self.row_start = np.searchsorted(self.post_of, np.arange(len(self.post_ids) + 1))
+        self._codes = {pid: code for code, pid in enumerate(self.post_ids)}
+        self.subjects = [None] * len(self.post_ids)
+        for code, subj in zip(codes.tolist(), chunk_subjects):
+            self.subjects[code] = subj
+
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        unit = (vectors / np.where(norms == 0, 1, norms))[order]
+        self.dim = vectors.shape[1]
+        self.dtype = dtype
+        self.scales = None
+        if dtype == "int8":
+            self.scales = np.abs(unit).max(axis=1, initial=0) / 127
+            self.matrix = np.round(unit / np.where(self.scales == 0, 1, self.scales)[:, None]).astype(np.int8)
+        elif dtype == "binary":
+            self.matrix = np.packbits(unit > 0, axis=1)
+        else:
+            self.matrix = np.ascontiguousarray(unit, dtype=dtype)
+
+        # rescoring source: full[full_rows[row]], at full's width
+        self.full = self.full_rows = None
+        if full is not None:
+            self.full = full
+            self.full_rows = (np.arange(len(unit)) if full_rows is None else np.asarray(full_rows))[order]
+        elif dtype in QUANTIZED:
+            self.full, self.full_rows = np.ascontiguousarray(unit, dtype=np.float32), np.arange(len(unit))
+        self.nbytes = self.matrix.nbytes + self.post_of.nbytes
+        for part in (self.scales, self.full_rows):
+            if part is not None:
+                self.nbytes += part.nbytes
+        if self.full is not None and not isinstance(self.full, np.memmap):
+            self.nbytes += self.full.nbytes
+
+    def candidate_rows(self, post_ids) -> np.ndarray:
+        """Rows of the given posts' chunks; unknown post ids are skipped."""
+        codes = np.array([self._codes[p] for p in post_ids if p in self._codes], dtype=np.int64)
+        starts, ends = self.row_start[codes], self.row_start[codes + 1]
+        lengths = ends - starts
+        # concatenated aranges: each post's start, then counting up within it
+        offsets = np.repeat(starts - np.concatenate([[0], np.cumsum(lengths)[:-1]]), lengths)
+        return offsets + np.arange(int(lengths.sum()))
+
+    def similarities(self, vectors, rows=None) -> np.ndarray:
+        """
+        Cosine similarity of each query to every chunk (or those in rows), one
+        row per query. Estimated from the compressed matrix when quantized.
+        """
+        matrix = self.matrix if rows is None else self.matrix[rows]
+        q = np.atleast_2d(np.asarray(vectors, dtype=np.float32))[:, :self.dim]
+        norms = np.linalg.norm(q, axis=1, keepdims=True)
+        q = q / np.where(norms == 0, 1, norms)
+        if self.dtype == "binary":
+            # 1 - 2 * (share of differing signs), a monotone stand-in for the angle
+            bits = np.packbits(q > 0, axis=1)
+            sims = np.empty((len(q), len(matrix)), dtype=np.float32)
+            for lo in range(0, len(matrix), SCAN_BLOCK):
+                block = matrix[lo:lo + SCAN_BLOCK]
+                differing = popcount(bits[:, None, :] ^ block[None, :, :]).sum(axis=2, dtype=np.int32)
+                sims[:, lo:lo + SCAN_BLOCK] = 1 - 2 * differing / self.dim
+            return sims
+        if matrix.dtype == np.float32:
+            return q @ matrix.T
+        if self.dtype == "int8":
+            scales = self.scales if rows is None else self.scales[rows]
+            if len(q) == 1:
+                # quantize the query too and accumulate in integers; still slower than a
+                # float32 BLAS product, but well ahead of widening every row for one query
+                q_scale = float(np.abs(q).max()) / 127 or 1.0
+                dots = np.einsum("nd,d->n", matrix, np.round(q[0] / q_scale).astype(np.int8), dtype=np.int32)
+                return (dots * (scales * q_scale)).astype(np.float32)[None, :]
+            # several queries share each widened block
+            sims = np.empty((len(q), len(matrix)), dtype=np.float32)
+            for lo in range(0, len(matrix), SCAN_BLOCK):
+                sims[:, lo:lo + SCAN_BLOCK] = (q @ matrix[lo:lo + SCAN_BLOCK].astype(np.float32).T
+                                               * scales[lo:lo + SCAN_BLOCK])
+            return sims
+        # numpy has no BLAS path for float16: widen a block at a time
+        sims = np.empty((len(q), len(matrix)), dtype=np.float32)
+        for lo in range(0, len(matrix), SCAN_BLOCK):
+            sims[:, lo:lo + SCAN_BLOCK] = q @ matrix[lo:lo + SCAN_BLOCK].astype(np.float32).T
+        return sims
+
+    def rescore(self, vector, rows: np.ndarray) -> np.ndarray:
+        """Full-precision cosine similarity of one query to the given rows."""
+        return full_similarities(self.full, self.full_rows[rows], vector)
+
+    def _search_one(self, sims, vector, n: int, rows=None) -> list:
+        if self.full is None:
+            return self._top_posts(sims, n, rows)
+        # keep the chunks the first pass ranks best and rank those at full precision
+        keep = min(len(sims), n * VECTOR_RESCORE_FACTOR)
+        top = np.argpartition(-sims, keep - 1)[:keep] if keep < len(sims) else np.arange(len(sims))
+        top_rows = top if rows is None else rows[top]
+        return self._top_posts(self.rescore(vector, top_rows), n, top_rows)
+
+    def _top_posts(self, sims, n: int, rows=None) -> list:
+        # the n best chunks, best first
+        if n < len(sims):
+            top = np.argpartition(-sims, n - 1)[:n]
+        else:
+            top = np.arange(len(sims))
+        top = top[np.argsort(-sims[top], kind="stable")]
+        # group by post: the first hit of each post is its best
+        codes = self.post_of[top if rows is None else rows[top]]
+        _, first = np.unique(codes, return_index=True)
+        first.sort()
+        return [{"post_id": self.post_ids[c], "subject": self.subjects[c], "score": float(s)}
+                for c, s in zip(codes[first].tolist(), sims[top][first].tolist())]
+
+    def search(self, vectors: list, n: int = 100, candidates: list = None) -> list:
+        """
+        Per query, the best similarity of each post among its n nearest chunks.
+        candidates, one list of post ids per query, restricts each query to
+        those posts' chunks.
+        """
+        if not len(self.matrix):
+            return [[] for _ in vectors]
+        if candidates is None:
+            return [self._search_one(sims, vector, n) for sims, vector in zip(self.similarities(vectors), vectors)]
+        results = []
+        for vector, post_ids in zip(vectors, candidates):
+            rows = self.candidate_rows(post_ids)
+            results.append(self._search_one(self.similarities([vector], rows)[0], vector, n, rows)
+                           if len(rows) else [])
+        return results
+
+
+BACKENDS = {
+    "chroma": ChromaVectorIndex,
+    "numpy": NumpyVectorIndex,
+    "numpy-int8": partial(NumpyVectorIndex, dtype="int8"),
+    "numpy-binary": partial(NumpyVectorIndex, dtype="binary"),
+}
+
+
+def open_vector_index(persist_dir, embedding_model, backend: str = None):
+    backend = backend or VECTOR_BACKEND
+    if backend not in BACKENDS:
+        raise ValueError(f"Unknown vector backend {backend!r}; expected one of {sorted(BACKENDS)}")
+    return BACKENDS[backend](persist_dir, embedding_model)
@@ -0,0 +1,68 @@
+import sys
+import time
+import requests
+
+from load_test import QUESTIONS
+
+# Compares answering QUESTIONS with one /api/search request each against a
+# single /api/search/batch request, on a running server (python serve.py).
+# The first round uses fresh query text so both paths pay for embeddings;
+# later rounds hit the query cache. Results must match query for query.
+#
+#   python batch_search_benchmark.py <network_id> [base_url] [rounds]
+
+
+def sequential(session, base_url, network_id, queries):
+    return [session.post(f"{base_url}/api/search",
+                         json={"network_id": network_id, "query": q, "k": 10},
+                         timeout=120).json()["results"]
+            for q in queries]
+
+
+def batched(session, base_url, network_id, queries):
+    resp = session.post(f"{base_url}/api/search/batch",
+                        json={"network_id": network_id, "queries": queries, "k": 10}, timeout=120)
+    resp.raise_for_status()
+    return [item["results"] for item in resp.json()["results"]]
+
+
+def same_results(a, b):
+    # scores can differ in the last bits between single and batched embedding requests
+    return [r["post_id"] for r in a] == [r["post_id"] for r in b]
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python batch_search_benchmark.py <network_id> [base_url] [rounds]")
+        sys.exit(1)
+    network_id = sys.argv[1]
+    base_url = sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:5000"
+    rounds = int(sys.argv[3]) if len(sys.argv) > 3 else 5
+    session = requests.Session()
+
+    stamp = int(time.time())
+    print(f"{len(QUESTIONS)} queries per round")
+    print(f"{'round':>9} {'sequential':>12} {'batch':>9} {'speedup':>8} {'q/s seq':>8} {'q/s batch':>10}")
+    for r in range(rounds):
+        # distinct text per path on the cold round, so neither reuses the other's embeddings
+        cold = r == 0
+        seq_q = [f"{q} ({stamp} s)" if cold else q for q in QUESTIONS]
+        batch_q = [f"{q} ({stamp} b)" if cold else q for q in QUESTIONS]
+
+        start = time.perf_counter()
+        seq = sequential(session, base_url, network_id, seq_q)
+        seq_s = time.perf_counter() - start
+        start = time.perf_counter()
+        batch = batched(session, base_url, network_id, batch_q)
+        batch_s = time.perf_counter() - start
+
+        if not cold:
+            mismatched = sum(not same_results(a, b) for a, b in zip(seq, batch))
+            assert mismatched == 0, f"{mismatched} queries ranked differently in the batch"
+        label = "cold" if cold else f"warm {r}"
+        print(f"{label:>9} {seq_s * 1000:>10.0f}ms {batch_s * 1000:>7.0f}ms {seq_s / batch_s:>7.1f}x "
+              f"{len(QUESTIONS) / seq_s:>8.1f} {len(QUESTIONS) / batch_s:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
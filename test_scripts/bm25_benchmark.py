@@ -0,0 +1,71 @@
+import sys
+import time
+import random
+from pathlib import Path
+
+import numpy as np
+from rank_bm25 import BM25Okapi
+
+# run from anywhere: import the backend modules directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from bm25_index import BM25Index, tokenize
+
+# Compares rank_bm25.BM25Okapi.get_top_n against the CSR scorer in bm25_index
+# on synthetic Piazza-sized corpora. Scores are checked for exact equality and
+# the top-100 candidate sets for equality up to ties at the cut-off. The batch
+# scorer is checked against the single-query one and timed over all queries at once.
+
+SIZES = [1_000, 10_000, 100_000]
+N_QUERIES = 40
+TOP_N = 100
+
+random.seed(0)
+# zipf-ish vocabulary: a few very common words and a long tail
+vocab = [f"term{i}" for i in range(20_000)]
+weights = [1.0 / (i + 1) for i in range(len(vocab))]
+
+
+def make_post():
+    return " ".join(random.choices(vocab, weights=weights, k=random.randint(20, 120)))
+
+
+def time_queries(fn, queries):
+    start = time.perf_counter()
+    for q in queries:
+        fn(q)
+    return (time.perf_counter() - start) / len(queries) * 1000
+
+
+for size in SIZES:
+    texts = [make_post() for _ in range(size)]
+    post_ids = [str(i) for i in range(size)]
+    tokenized = [tokenize(t) for t in texts]
+    queries = [tokenize(" ".join(random.choices(vocab[:5000], k=random.randint(3, 8))))
+               for _ in range(N_QUERIES)]
+
+    t0 = time.perf_counter()
+    okapi = BM25Okapi(tokenized)
+    t1 = time.perf_counter()
+    index = BM25Index.from_corpus(post_ids, tokenized)
+    t2 = time.perf_counter()
+
+    for q in queries:
+        expected = okapi.get_scores(q)
+        actual = index.get_scores(q)
+        assert np.array_equal(expected, actual), "scores differ from BM25Okapi"
+        top_okapi = np.argsort(expected)[::-1][:TOP_N]
+        top_csr = index.top_n_docs(actual, TOP_N)
+        assert sorted(expected[top_okapi]) == sorted(actual[top_csr]), "top-n differs from BM25Okapi"
+
+    batch_scores = index.get_scores_batch(queries)
+    for q, row in zip(queries, batch_scores):
+        assert np.array_equal(index.get_scores(q), row), "batch scores differ from single-query scores"
+    assert index.get_top_n_batch(queries, n=TOP_N) == [index.get_top_n(q, n=TOP_N) for q in queries]
+
+    okapi_ms = time_queries(lambda q: okapi.get_top_n(q, post_ids, n=TOP_N), queries)
+    csr_ms = time_queries(lambda q: index.get_top_n(q, n=TOP_N), queries)
+    batch_ms = time_queries(lambda _: index.get_top_n_batch(queries, n=TOP_N), [None]) / len(queries)
+
+    print(f"{size:>7} posts | build okapi {t1 - t0:6.2f}s  csr {t2 - t1:6.2f}s | "
+          f"top-{TOP_N} okapi {okapi_ms:9.2f} ms  csr {csr_ms:7.3f} ms  batch {batch_ms:7.3f} ms | "
+          f"speedup {okapi_ms / csr_ms:7.1f}x")
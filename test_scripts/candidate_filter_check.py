@@ -0,0 +1,70 @@
+import ast
+import sys
+import time
+import statistics
+from pathlib import Path
+
+# run from anywhere: import the backend modules directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from bm25_index import tokenize
+from search_lib import CourseEngine
+
+# Compares the semantic stage before and after it was restricted to the BM25
+# candidates, on the automated_testing.py questions:
+#   before: 100 nearest chunks over the whole course, then dropped unless
+#           their post is in the BM25 top 100
+#   after:  100 nearest chunks among the BM25 top 100 posts only
+# Reports latency of the semantic stage and how many of the k results come back.
+# Run from backend/ so data/<network_id> is found:
+#
+#   python ../test_scripts/candidate_filter_check.py <network_id> [chroma|numpy]
+
+K = 10
+TOP_N = 100
+
+
+def automated_testing_questions() -> list:
+    # read the list literal without running the script (it rebuilds an index)
+    source = (Path(__file__).resolve().parent / "automated_testing.py").read_text(encoding="utf-8")
+    for node in ast.parse(source).body:
+        if isinstance(node, ast.Assign) and any(getattr(t, "id", None) == "questions" for t in node.targets):
+            return ast.literal_eval(node.value)
+    raise ValueError("no questions list in automated_testing.py")
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python candidate_filter_check.py <network_id> [chroma|numpy]")
+        sys.exit(1)
+    backend = sys.argv[2] if len(sys.argv) > 2 else None
+    engine = CourseEngine(sys.argv[1], backend=backend)
+    questions = automated_testing_questions()
+    # embeddings and BM25 are shared by both paths and left out of the timings
+    vectors = engine.embedding_model.embed_documents(questions)
+    candidates = engine.bm25.get_top_n_batch([tokenize(q) for q in questions], n=TOP_N)
+
+    rows = []
+    for vector, bm25_ids in zip(vectors, candidates):
+        start = time.perf_counter()
+        posts = engine.vectors.search([vector], n=TOP_N)[0]
+        bm25_set = set(bm25_ids)
+        before = [p for p in posts if p["post_id"] in bm25_set][:K]
+        before_ms = (time.perf_counter() - start) * 1000
+
+        start = time.perf_counter()
+        after = engine.vectors.search([vector], n=TOP_N, candidates=[bm25_ids])[0][:K]
+        after_ms = (time.perf_counter() - start) * 1000
+        rows.append((len(before), len(after), before_ms, after_ms))
+
+    print(f"{len(questions)} questions, k={K}, backend {type(engine.vectors).__name__}")
+    print(f"{'':>7} {'mean results':>13} {'min':>4} {'< k':>4} {'empty':>6} {'p50 ms':>8} {'mean ms':>8}")
+    for label, n_col, ms_col in (("before", 0, 2), ("after", 1, 3)):
+        counts = [r[n_col] for r in rows]
+        times = [r[ms_col] for r in rows]
+        print(f"{label:>7} {statistics.mean(counts):>13.1f} {min(counts):>4} "
+              f"{sum(c < K for c in counts):>4} {sum(c == 0 for c in counts):>6} "
+              f"{statistics.median(times):>8.2f} {statistics.mean(times):>8.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import sys
+import tempfile
+import subprocess
+from pathlib import Path
+
+import numpy as np
+
+# run from anywhere: import the backend modules directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from vector_index import ChromaVectorIndex, NumpyVectorIndex
+
+# Checks that a vector index opened in a long-running process (the API) sees
+# chunks another process (build_db) added after the first one was loaded:
+# this process indexes FIRST chunks and queries them, a child process adds
+# ADDED more, then newly opened Chroma and numpy indexes must find all of
+# them, while the index opened first keeps answering, dropping candidate
+# posts it hasn't loaded instead of failing the query.
+#
+#   python chroma_reload_check.py
+
+DIM = 16
+FIRST, ADDED = 20, 50
+
+
+def add_chunks(persist_dir: str, lo: int, hi: int):
+    """Chunks lo..hi-1 with random vectors, one per post, as build_db stores them."""
+    import chromadb
+    collection = chromadb.PersistentClient(path=persist_dir).get_or_create_collection(
+        "langchain", metadata={"hnsw:space": "cosine"})
+    rng = np.random.default_rng(lo)
+    collection.add(ids=[f"chunk{i}" for i in range(lo, hi)],
+                   embeddings=rng.normal(size=(hi - lo, DIM)).astype(np.float32),
+                   metadatas=[{"post_id": str(i), "subject": f"post {i}"} for i in range(lo, hi)],
+                   documents=[f"text of post {i}" for i in range(lo, hi)])
+
+
+def found(index, candidates=None) -> set:
+    query = np.ones(DIM, dtype=np.float32).tolist()
+    return {r["post_id"] for r in index.search([query], n=FIRST + ADDED, candidates=candidates)[0]}
+
+
+def main():
+    if sys.argv[1:2] == ["--add"]:
+        add_chunks(sys.argv[2], FIRST, FIRST + ADDED)
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        persist_dir = str(Path(tmp) / "db")
+        add_chunks(persist_dir, 0, FIRST)
+        first = ChromaVectorIndex(persist_dir, None)
+        assert len(found(first)) == FIRST, "first index misses its own chunks"
+
+        subprocess.run([sys.executable, __file__, "--add", persist_dir], check=True)
+        everything = {str(i) for i in range(FIRST + ADDED)}
+        added = [str(i) for i in range(FIRST, FIRST + ADDED)]
+
+        reopened = ChromaVectorIndex(persist_dir, None)
+        assert found(reopened) == everything, f"reopened chroma index finds {len(found(reopened))} posts"
+        assert found(reopened, [added]) == set(added), "reopened chroma index misses added candidates"
+        assert reopened.nbytes == (FIRST + ADDED) * DIM * 4, f"chroma size estimated as {reopened.nbytes} bytes"
+        numpy_index = NumpyVectorIndex(persist_dir, None)
+        assert set(numpy_index.post_ids) == everything, f"numpy index loaded {len(numpy_index.post_ids)} posts"
+        assert len(found(first)) == FIRST, "first index stopped answering once another was opened"
+        assert found(first, [["0"] + added]) == {"0"}, "first index returned posts it never loaded"
+        print(f"{FIRST} + {ADDED} chunks from another process visible to reopened chroma and numpy indexes")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,62 @@
+import sys
+import random
+from pathlib import Path
+
+# run from anywhere: import the backend modules directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from chunking import Chunker, count_tokens
+
+# Checks that every accepted chunking spec keeps every sentence of a post, in
+# order, for posts of 0-40 sentences, that token packing stays within its
+# budget except for single over-long sentences, and that malformed specs
+# (including window steps larger than the window) are rejected.
+
+random.seed(0)
+
+SPECS = ["sentences", "window:1", "window:2", "window:3", "window:3:2", "window:3:3",
+         "window:5:4", "window:8", "tokens:1", "tokens:16", "tokens:64", "tokens:512"]
+REJECTED = ["sentence", "window", "window:0", "window:2:3", "window:3:0", "window:1:2",
+            "window:a", "tokens", "tokens:0", "tokens:5:1", "sentences:2", "bogus:3"]
+WORDS = ["lab", "exam", "grade", "pointer", "recursion", "deadline", "office", "hours", "a", "the"]
+
+
+def sentence(i: int) -> str:
+    # a unique marker so each sentence can be found in the chunks
+    return f"S{i} " + " ".join(random.choices(WORDS, k=random.randint(0, 30))) + "."
+
+
+def check(spec: str):
+    chunker = Chunker(spec)
+    assert Chunker(chunker.spec).spec == chunker.spec, f"{spec}: canonical spec {chunker.spec} not stable"
+    for n in range(41):
+        sentences = [sentence(i) for i in range(n)]
+        chunks = chunker.chunk(sentences)
+        assert bool(chunks) == bool(sentences), f"{spec}, {n} sentences: {len(chunks)} chunks"
+        # every sentence appears in some chunk, and chunks are contiguous runs of sentences
+        covered = set()
+        for chunk in chunks:
+            run = [i for i, s in enumerate(sentences) if f"S{i} " in chunk and s in chunk]
+            assert run == list(range(run[0], run[-1] + 1)), f"{spec}: non-contiguous chunk {chunk!r}"
+            assert chunk == " ".join(sentences[run[0]:run[-1] + 1]), f"{spec}: chunk {chunk!r} altered"
+            covered.update(run)
+            if chunker.name == "tokens" and len(run) > 1:
+                assert count_tokens(chunk) <= chunker.max_tokens, f"{spec}: chunk over budget"
+        missing = sorted(set(range(n)) - covered)
+        assert not missing, f"{spec}, {n} sentences: sentences {missing} not in any chunk"
+
+
+def main():
+    for spec in SPECS:
+        check(spec)
+    print(f"{len(SPECS)} specs keep every sentence for posts of 0-40 sentences")
+    for spec in REJECTED:
+        try:
+            Chunker(spec)
+        except ValueError:
+            continue
+        raise AssertionError(f"spec {spec!r} was accepted")
+    print(f"{len(REJECTED)} malformed specs rejected")
+
+
+if __name__ == "__main__":
+    main()
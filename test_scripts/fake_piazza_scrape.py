@@ -0,0 +1,131 @@
+import os
+import sys
+import json
+import time
+import random
+import tempfile
+import threading
+from pathlib import Path
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Scrapes a local fake Piazza that injects latency, random 429s, slow responses
+# and a hard capacity limit, to check that the scraper's adaptive rate limiter
+# backs off under throttling, recovers afterwards, and still stores every post.
+
+N_POSTS = 300
+CAPACITY = 8.0  # requests per second the fake server accepts before answering 429
+THROTTLE_P = 0.03  # chance of a random 429
+SLOW_P = 0.02  # chance of a response slower than SCRAPE_SLOW_LATENCY
+LATENCY = (0.02, 0.2)  # seconds, normal responses
+
+random.seed(0)
+BACKEND = Path(__file__).resolve().parent.parent / "backend"
+
+
+def make_post(nr: int) -> dict:
+    return {
+        "id": f"post{nr}", "nr": nr, "type": "question", "created": "2024-01-01T00:00:00Z",
+        "history": [{"subject": f"Question {nr}", "content": f"<p>How do I solve part {nr}?</p>"}],
+        "children": [],
+    }
+
+
+class FakePiazza(BaseHTTPRequestHandler):
+    lock = threading.Lock()
+    window = []  # arrival times within the last second
+    requests = throttled = 0
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+        now = time.monotonic()
+        with self.lock:
+            FakePiazza.requests += 1
+            FakePiazza.window = [t for t in self.window if now - t < 1.0] + [now]
+            over = len(self.window) > CAPACITY
+        if over or random.random() < THROTTLE_P:
+            with self.lock:
+                FakePiazza.throttled += 1
+            self.send_response(429)
+            self.send_header("Content-Type", "text/html")
+            self.end_headers()
+            self.wfile.write(b"<html>Too Many Requests</html>")
+            return
+        time.sleep(4.0 if random.random() < SLOW_P else random.uniform(*LATENCY))
+
+        if body["method"] == "network.get_my_feed":
+            result = {"feed": [{"id": f"post{nr}", "nr": nr, "modified": "2024-01-01T00:00:00Z"}
+                               for nr in range(N_POSTS, 0, -1)]}
+        elif body["method"] == "content.get":
+            result = make_post(int(body["params"]["cid"][len("post"):]))
+        else:
+            result = None
+        payload = json.dumps({"result": result, "error": None if result else "unknown method"}).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(payload)))
+        self.end_headers()
+        self.wfile.write(payload)
+
+    def log_message(self, *args):
+        pass
+
+
+def main():
+    server = ThreadingHTTPServer(("127.0.0.1", 0), FakePiazza)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    base = f"http://127.0.0.1:{server.server_port}"
+
+    # the scraper reads auth.json and writes data/ relative to the working directory
+    work = tempfile.mkdtemp()
+    os.chdir(work)
+    Path("auth.json").write_text(json.dumps({"fakecourse": {"email": "me@example.com", "password": "x"}}))
+    sys.path.insert(0, str(BACKEND))
+
+    from piazza_api import rpc
+    original_init = rpc.PiazzaRPC.__init__
+
+    def local_init(self, network_id=None):
+        original_init(self, network_id)
+        self.base_api_urls = {"logic": base + "/logic/api", "main": base + "/main/api"}
+
+    def fake_login(self, email=None, password=None):
+        self.session.cookies.set("session_id", "fake", domain="127.0.0.1")
+
+    rpc.PiazzaRPC.__init__ = local_init
+    rpc.PiazzaRPC.user_login = fake_login
+
+    import scraper
+    account = scraper.get_account(scraper.auth_map["fakecourse"])
+    account.limiter.max_rate = 20.0  # let it climb past the server's capacity
+
+    rates = []
+    stop = threading.Event()
+
+    def sample():
+        while not stop.wait(1.0):
+            rates.append(account.limiter.stats()["rate"])
+
+    threading.Thread(target=sample, daemon=True).start()
+    start = time.monotonic()
+    fetched, skipped = scraper.process_course("fakecourse", account)
+    elapsed = time.monotonic() - start
+    stop.set()
+
+    stats = account.limiter.stats()
+    stored = scraper.PostStore.for_course("fakecourse").count()
+    print(f"\nfetched {fetched}, stored {stored}/{N_POSTS} in {elapsed:.1f}s "
+          f"(fixed {scraper.RATE_LIMIT}s pacing: >= {N_POSTS * scraper.RATE_LIMIT:.0f}s)")
+    print(f"server: {FakePiazza.requests} requests, {FakePiazza.throttled} answered 429")
+    print(f"limiter: {stats}")
+    print("rate per second sampled:", " ".join(f"{r:.1f}" for r in rates))
+    assert stored == N_POSTS, "every post should survive throttling"
+    assert stats["throttled"] > 0 and stats["rate"] <= account.limiter.max_rate
+
+    # a second pass has nothing to fetch (and stops at the first post, which is old)
+    fetched, skipped = scraper.process_course("fakecourse", account)
+    assert fetched == 0
+    server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,136 @@
+import sys
+import time
+import random
+import warnings
+from pathlib import Path
+
+from bs4 import BeautifulSoup, MarkupResemblesLocatorWarning
+
+# run from anywhere: import the backend modules directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from post import extract_html, create_post_from_api
+
+# Checks post.extract_html against BeautifulSoup(html, 'html.parser') +
+# get_text(' ', strip=True) + find_all('img') on hand-written Piazza-style
+# fixtures and a few thousand fuzzed fragments, compares create_post_from_api
+# with the BeautifulSoup version it replaced, then times both.
+
+warnings.filterwarnings("ignore", category=MarkupResemblesLocatorWarning)
+random.seed(0)
+
+FIXTURES = [
+    "",
+    "plain text, no markup",
+    "   \n  ",
+    "<p>Hello <b>world</b></p><p>second</p>",
+    "<p>a&amp;b &lt;c&gt; &nbsp;x&nbsp;</p>",
+    "caf&eacute; &copy 2024 &notanentity; &amp",
+    "&#65;&#x42;&#X43;&#128;&#x81;&#0;&#55296;&#1114112;&#65abc",
+    "<div><img src=\"/redirect/s3?bucket=uploads&amp;prefix=a.png\"/> caption</div>",
+    "<img src=''><img><img src=\"b.png\" src=\"c.png\"><IMG SRC=\"d.png\">",
+    "<pre>  code\n    indented  </pre><code>x = 1</code>",
+    "<script>var x = '<p>hidden</p>';</script>shown<style>p { color: red }</style>",
+    "<template><p>inert</p></template><ruby>漢<rp>(</rp><rt>kan</rt><rp>)</rp></ruby>",
+    "<!-- a comment -->text<!DOCTYPE html><?php echo 1 ?>more",
+    "<![CDATA[ raw <b>cdata</b> ]]>after",
+    "<br>line one<br/>line two</br>line three",
+    "<p>unclosed <i>italic <b>bold</p> tail</i> end",
+    "1 < 2 and 3 > 2, a<b",
+    "<ul><li>one</li><li>two<ul><li>nested</li></ul></li></ul>",
+    "<table><tr><td>a</td><td>b</td></tr></table>",
+    "<p>math: <span class=\"math\">\\(x^2\\)</span></p>",
+    "<md>**markdown** body</md>",
+    "<a href=\"https://piazza.com/class/abc?cid=12\">@12</a>",
+    "<p>  non-breaking </p>",
+    "<script>unterminated",
+    "<p>trailing <",
+]
+
+TOKENS = [
+    "<p>", "</p>", "<b>", "</b>", "<br>", "</br>", "<br/>", "<img src=\"i.png\">", "<img src=''>",
+    "<script>", "</script>", "<style>", "</style>", "<template>", "</template>", "<rt>", "</rt>",
+    "<rp>", "</rp>", "<!-- c -->", "<![CDATA[cd]]>", "<!x>", "<?pi?>", "<pre>", "</pre>", "<div/>",
+    "&amp;", "&lt;", "&nbsp;", "&#150;", "&#x41;", "&bogus;", "&", "<", ">", " ", "\n", " ",
+    "word", "other", "x", "</div>", "<div>", "<textarea>", "</textarea>", "<title>", "</title>",
+]
+
+
+def bs4_extract(html):
+    soup = BeautifulSoup(html, 'html.parser')
+    return (soup.get_text(separator=' ', strip=True),
+            [img['src'] for img in soup.find_all('img') if img.get('src')])
+
+
+def create_post_bs4(raw):
+    """create_post_from_api as it was, parsing every child with BeautifulSoup."""
+    history = raw.get('history', [])
+    content, image_urls = bs4_extract((history[0] if history else {}).get('content', ''))
+    instructor_answer = endorsed_answer = None
+    for child in raw.get('children', []):
+        ch_history = child.get('history', [])
+        latest = ch_history[-1] if ch_history else {}
+        child_text, _ = bs4_extract(latest.get('content', ''))
+        if child.get('type') == 'i_answer' and instructor_answer is None:
+            instructor_answer = child_text or None
+        if child.get('type') in ('s_answer', 'followup') and endorsed_answer is None:
+            endorsements = child.get('tag_endorse', []) + child.get('tag_good', [])
+            if any(e.get('role') in ('instructor', 'professor') for e in endorsements):
+                endorsed_answer = child_text or None
+        if instructor_answer is not None and endorsed_answer is not None:
+            break
+    return content, image_urls, instructor_answer, endorsed_answer
+
+
+def fake_html(paragraphs):
+    words = ["lab", "pointer", "segfault", "malloc", "recursion", "test", "case", "&amp;", "<b>why</b>"]
+    parts = []
+    for _ in range(paragraphs):
+        parts.append("<p>" + " ".join(random.choices(words, k=random.randint(10, 40))) + "</p>")
+        if random.random() < 0.2:
+            parts.append("<pre><code>int *p = malloc(4);\nfree(p);</code></pre>")
+        if random.random() < 0.1:
+            parts.append("<img src=\"/redirect/s3?bucket=uploads&amp;prefix=paste.png\" />")
+    return "".join(parts)
+
+
+def fake_post(nr):
+    children = []
+    for i in range(random.randint(0, 30)):
+        kind = random.choice(["followup", "followup", "s_answer", "i_answer"])
+        child = {"type": kind, "history": [{"content": fake_html(random.randint(1, 4))}]}
+        if kind == "followup":
+            # followups keep their text in "subject" and nested children
+            child = {"type": kind, "subject": fake_html(1), "children": [], "tag_good": []}
+        if random.random() < 0.1:
+            child["tag_endorse"] = [{"role": "instructor"}]
+        children.append(child)
+    return {"nr": nr, "history": [{"subject": f"Question {nr}", "content": fake_html(random.randint(1, 6))}],
+            "children": children}
+
+
+def main():
+    for html in FIXTURES:
+        assert extract_html(html) == bs4_extract(html), html
+    print(f"{len(FIXTURES)} fixtures identical")
+
+    for n in range(5000):
+        html = "".join(random.choices(TOKENS, k=random.randint(1, 30)))
+        assert extract_html(html) == bs4_extract(html), html
+    print("5000 fuzzed fragments identical")
+
+    posts = [fake_post(nr) for nr in range(500)]
+    for raw in posts:
+        new = create_post_from_api(raw)
+        assert (new.content, new.image_urls, new.instructor_answer, new.endorsed_answer) == create_post_bs4(raw)
+    print(f"{len(posts)} synthetic posts identical")
+
+    for name, fn in (("BeautifulSoup", create_post_bs4), ("streaming", create_post_from_api)):
+        start = time.perf_counter()
+        for raw in posts:
+            fn(raw)
+        elapsed = time.perf_counter() - start
+        print(f"{name:>13}: {elapsed * 1000 / len(posts):.2f} ms/post")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,69 @@
+import sys
+import json
+import argparse
+import subprocess
+from pathlib import Path
+
+# Where backend startup time goes: runs `python -X importtime -c "import <module>"`
+# in a fresh interpreter from the backend directory and sums the cumulative
+# import time of each top-level package.
+#
+#   python import_time_benchmark.py [--modules api,scraper] [--top 15] [--out imports.json]
+#   python import_time_benchmark.py --backend /tmp/old/backend   another checkout, e.g. from
+#                                   `git worktree add /tmp/old <commit>`, for a before/after comparison
+#
+# Needs the backend's auth.json (api.py reads it at import) but makes no network calls itself.
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+MODULES = ["api", "search_lib", "scraper", "build_db"]
+ROUNDS = 3  # best of, to skip cold disk caches
+
+
+def import_times(backend: Path, module: str) -> dict:
+    """Wall seconds to import module, and cumulative seconds per top-level package it pulled in."""
+    proc = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c",
+         f"import time; t = time.perf_counter(); import {module}; print(time.perf_counter() - t)"],
+        cwd=backend, capture_output=True, text=True,
+    )
+    if proc.returncode != 0:
+        raise RuntimeError(f"importing {module} failed:\n{proc.stderr[-2000:]}")
+
+    packages = {}
+    for line in proc.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package, indented by nesting depth
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        # nested imports are already counted in their parent's cumulative time
+        if not cumulative.strip().isdigit() or len(name) - len(name.lstrip()) != 1:
+            continue
+        top = name.strip().split(".")[0]
+        packages[top] = packages.get(top, 0) + int(cumulative) / 1e6
+    return {"seconds": float(proc.stdout.strip().splitlines()[-1]), "packages": packages}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Import time of the backend entry points.")
+    parser.add_argument("--backend", default=str(BACKEND_DIR), help="backend directory to measure")
+    parser.add_argument("--modules", default=",".join(MODULES), help="comma-separated modules to import")
+    parser.add_argument("--top", type=int, default=15, help="packages listed per module")
+    parser.add_argument("--out", help="write results as json to this file")
+    args = parser.parse_args()
+
+    report = {}
+    for module in args.modules.split(","):
+        runs = [import_times(Path(args.backend), module) for _ in range(ROUNDS)]
+        best = min(runs, key=lambda r: r["seconds"])
+        report[module] = best
+        print(f"import {module}: {best['seconds'] * 1000:.0f} ms")
+        for name, seconds in sorted(best["packages"].items(), key=lambda kv: -kv[1])[:args.top]:
+            print(f"  {name:<28} {seconds * 1000:>8.1f} ms")
+
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
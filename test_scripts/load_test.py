@@ -0,0 +1,93 @@
+import sys
+import time
+import random
+import threading
+import statistics
+import requests
+from concurrent.futures import ThreadPoolExecutor
+
+# Measures /api/search throughput and latency against a running server
+# (python serve.py) at 1, 8 and 32 concurrent clients.
+#
+#   python load_test.py <network_id> [base_url] [seconds_per_level]
+
+CLIENT_LEVELS = [1, 8, 32]
+
+# a sample of the questions in automated_testing.py
+QUESTIONS = [
+    "How do we submit Lab 0?",
+    "Should we be rounding in Lab 1?",
+    "Do we need to pass hidden test cases for full marks?",
+    "Why do we need to use % for printf?",
+    "Can inputs be negative in Lab 2 Part 3?",
+    "Does the math library use radians or degrees?",
+    "What is the midterm scope?",
+    "Is it necessary to always initialize variables?",
+    "What is a seed when using the rand function?",
+    "What does it mean to free dynamically allocated memory?",
+    "How are we being marked for lab 8?",
+    "What is a seg fault, and how can I find when/where it happens?",
+    "How can I safely allocate memory inside a function?",
+    "When should I use recursion vs. loops, and can I combine them?",
+]
+
+
+def run_level(base_url: str, network_id: str, clients: int, seconds: float) -> dict:
+    latencies, errors = [], []
+    lock = threading.Lock()
+    deadline = time.perf_counter() + seconds
+
+    def client(seed):
+        rng = random.Random(seed)
+        session = requests.Session()
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            try:
+                resp = session.post(f"{base_url}/api/search",
+                                    json={"network_id": network_id, "query": rng.choice(QUESTIONS), "k": 10},
+                                    timeout=60)
+                ok = resp.status_code == 200
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - start
+            with lock:
+                (latencies if ok else errors).append(elapsed)
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=clients) as pool:
+        list(pool.map(client, range(clients)))
+    wall = time.perf_counter() - start
+
+    latencies.sort()
+    pick = lambda q: latencies[min(len(latencies) - 1, int(q * len(latencies)))] * 1000 if latencies else 0.0
+    return {
+        "clients": clients,
+        "requests": len(latencies),
+        "errors": len(errors),
+        "throughput": len(latencies) / wall,
+        "p50_ms": pick(0.50),
+        "p95_ms": pick(0.95),
+        "mean_ms": statistics.mean(latencies) * 1000 if latencies else 0.0,
+    }
+
+
+def main():
+    if len(sys.argv) < 2:
+        print("usage: python load_test.py <network_id> [base_url] [seconds_per_level]")
+        sys.exit(1)
+    network_id = sys.argv[1]
+    base_url = sys.argv[2] if len(sys.argv) > 2 else "http://127.0.0.1:5000"
+    seconds = float(sys.argv[3]) if len(sys.argv) > 3 else 20.0
+
+    ready = requests.get(f"{base_url}/api/ready", timeout=10)
+    print(f"ready: {ready.status_code} {ready.json()}")
+
+    print(f"{'clients':>7} {'requests':>8} {'errors':>6} {'req/s':>8} {'p50 ms':>8} {'p95 ms':>8}")
+    for clients in CLIENT_LEVELS:
+        r = run_level(base_url, network_id, clients, seconds)
+        print(f"{r['clients']:>7} {r['requests']:>8} {r['errors']:>6} {r['throughput']:>8.1f} "
+              f"{r['p50_ms']:>8.1f} {r['p95_ms']:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,320 @@
+import io
+import os
+import re
+import sys
+import json
+import time
+import random
+import shutil
+import hashlib
+import argparse
+import platform
+import resource
+import tempfile
+import subprocess
+import contextlib
+from pathlib import Path
+
+import numpy as np
+
+from candidate_filter_check import automated_testing_questions
+
+# Offline benchmark of the search pipeline on synthetic Piazza-shaped courses.
+# No network access or API key is needed: embeddings come from a deterministic
+# hashed bag-of-words stand-in and chunks from a regex sentence splitter.
+#
+# For each corpus size and chunking strategy, a child process builds the course
+# with build_db (timing posts/sec and chunks/sec), then for each vector backend measures
+#   cold latency   search_top_k, which opens the course's indexes on every call
+#   warm latency   one CourseEngine reused, p50/p95/p99 and a per-stage breakdown
+#   recall@k       on the automated_testing.py questions, each of which has
+#                  RELEVANT_PER_QUESTION posts planted in the corpus
+#   peak memory    the child's max resident set size
+# Everything is seeded, so runs on one machine differ only by timing noise.
+#
+#   python search_benchmark.py [--sizes 1000,10000] [--backends chroma,numpy]
+#                              [--chunking sentences,window:3,tokens:128] [--out bench.json]
+
+BACKEND_DIR = Path(__file__).resolve().parent.parent / "backend"
+SIZES = [1_000, 10_000, 100_000]
+BACKENDS = ["chroma", "numpy"]
+CHUNKING = ["sentences"]  # chunking specs, see backend/chunking.py
+DIM = 256  # fake embedding width
+SEED = 0
+RELEVANT_PER_QUESTION = 3  # posts written as answers to each question
+NEAR_MISSES_PER_QUESTION = 5  # posts sharing some of each question's words
+K_VALUES = (3, 10)
+COLD_QUERIES = 3  # each reopens the course, which for numpy means reloading every vector
+WARM_ROUNDS = 5
+COURSE = "bench"
+
+STOPWORDS = {
+    "a", "an", "and", "are", "as", "at", "be", "can", "do", "does", "for", "how", "i", "if", "in", "is",
+    "it", "of", "on", "or", "the", "there", "to", "we", "what", "when", "where", "which", "why", "will",
+    "with", "you", "your", "s", "t", "them", "between", "into", "their", "this", "that", "our", "my",
+}
+WORD_RE = re.compile(r"[a-z]+|\d+")
+SYLLABLES = [c + v for c in "bdfgklmnprstvz" for v in "aeiou"]
+
+
+class FakeEmbeddings:
+    """Deterministic stand-in for OpenAIEmbeddings: signed hashed bag of words, unit length."""
+    model = "offline-hash"
+
+    def __init__(self, dim: int = DIM):
+        self.dim = dim
+        self._slots = {}
+
+    def _slot(self, word):
+        slot = self._slots.get(word)
+        if slot is None:
+            h = int.from_bytes(hashlib.md5(word.encode()).digest()[:8], "little")
+            slot = self._slots[word] = (h % self.dim, 1.0 if h >> 63 else -1.0)
+        return slot
+
+    def embed_documents(self, texts):
+        vectors = np.zeros((len(texts), self.dim), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in WORD_RE.findall(text.lower()):
+                i, sign = self._slot(word)
+                vectors[row, i] += sign
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        vectors /= np.where(norms == 0, 1, norms)
+        return vectors.tolist()
+
+    def embed_query(self, text):
+        return self.embed_documents([text])[0]
+
+
+class SentenceSplitter:
+    """Offline replacement for the NLTK sentence splitter."""
+    def split_text(self, text):
+        return [s.strip() for s in re.split(r"(?<=[.?!])\s+", text) if s.strip()]
+
+
+def pseudo_word(i: int) -> str:
+    word = ""
+    while True:
+        word += SYLLABLES[i % len(SYLLABLES)]
+        i //= len(SYLLABLES)
+        if not i:
+            return word
+
+
+def make_corpus(n_posts: int, questions: list, rng: random.Random):
+    """Posts keyed by id, and for each question the ids of the posts that answer it."""
+    vocab = [pseudo_word(i) for i in range(20_000)]
+    cum = list(np.cumsum([1.0 / (i + 1) for i in range(len(vocab))]))
+    keywords = [[w for w in WORD_RE.findall(q.lower()) if w not in STOPWORDS] for q in questions]
+    all_keywords = sorted({w for words in keywords for w in words})
+
+    def filler(n):
+        words = rng.choices(vocab, cum_weights=cum, k=n)
+        # question words turn up everywhere at a low rate, as lexical distractors
+        return [rng.choice(all_keywords) if rng.random() < 0.05 else w for w in words]
+
+    def sentence(words):
+        return " ".join(words).capitalize() + "."
+
+    def post(subject_words, sentences):
+        body = {"subject": " ".join(subject_words).capitalize() + "?", "content": " ".join(sentences),
+                "has_instructor_answer": False, "has_instructor_endorsement": False,
+                "has_image": False, "is_pinned": False}
+        if rng.random() < 0.5:
+            body["instructor_answer"] = " ".join(sentence(filler(rng.randint(6, 16)))
+                                                 for _ in range(rng.randint(1, 3)))
+            body["has_instructor_answer"] = True
+        return body
+
+    posts = {str(i): post(filler(rng.randint(4, 9)), [sentence(filler(rng.randint(6, 16)))
+                                                      for _ in range(rng.randint(1, 6))])
+             for i in range(n_posts)}
+
+    # overwrite random posts with answers and near misses for each question
+    slots = rng.sample(range(n_posts), len(questions) * (RELEVANT_PER_QUESTION + NEAR_MISSES_PER_QUESTION))
+    relevant = []
+    for words in keywords:
+        ids = []
+        for _ in range(RELEVANT_PER_QUESTION):
+            pid = str(slots.pop())
+            shown = rng.sample(words, max(1, len(words) - 1))
+            answer = rng.sample(words, max(1, (len(words) + 1) // 2)) + filler(rng.randint(3, 8))
+            rng.shuffle(answer)
+            posts[pid] = post(shown + filler(2), [sentence(answer)] +
+                              [sentence(filler(rng.randint(6, 16))) for _ in range(rng.randint(0, 4))])
+            ids.append(pid)
+        for _ in range(NEAR_MISSES_PER_QUESTION):
+            pid = str(slots.pop())
+            partial = rng.sample(words, max(1, len(words) // 3))
+            posts[pid] = post(partial + filler(rng.randint(3, 6)),
+                              [sentence(partial + filler(rng.randint(4, 10)))] +
+                              [sentence(filler(rng.randint(6, 16))) for _ in range(rng.randint(0, 4))])
+        relevant.append(ids)
+    return posts, relevant
+
+
+def percentiles(samples: list) -> dict:
+    ms = np.asarray(samples) * 1000
+    return {"p50": float(np.percentile(ms, 50)), "p95": float(np.percentile(ms, 95)),
+            "p99": float(np.percentile(ms, 99)), "mean": float(ms.mean())}
+
+
+def peak_rss_mb() -> float:
+    # kilobytes on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def run_size(work: Path, n_posts: int, backends: list, dim: int, chunking: str) -> dict:
+    """Build one synthetic course in the scratch directory work and benchmark it (child process)."""
+    os.chdir(work)
+    Path("auth.json").write_text(json.dumps({COURSE: {"email": "bench@example.com", "password": "x",
+                                                      "chunking": chunking}}))
+    os.environ.setdefault("OPENAI_API_KEY", "offline")  # clients are constructed but never called
+    sys.path.insert(0, str(BACKEND_DIR))
+
+    with contextlib.redirect_stdout(io.StringIO()), contextlib.redirect_stderr(io.StringIO()):
+        import build_db
+        import search_lib
+        from embedding_store import EmbeddingStore
+        from post_store import PostStore
+    fake = FakeEmbeddings(dim)
+    build_db.embedding_model = fake
+    build_db.embedding_store = EmbeddingStore(fake.model)
+    build_db.splitter = SentenceSplitter()
+    search_lib.embedding_client = lambda: fake
+
+    questions = automated_testing_questions()
+    posts, relevant = make_corpus(n_posts, questions, random.Random(SEED))
+    PostStore.for_course(COURSE).put_many(posts)
+
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        ok = build_db.update_course(COURSE)
+    build_s = time.perf_counter() - start
+    if not ok:
+        raise RuntimeError("build_db.update_course failed: " + Path("build_db.log").read_text())
+    n_chunks = search_lib.CourseEngine(COURSE, backend="chroma").vectors.db._collection.count()
+    result = {
+        "posts": n_posts,
+        "chunking": chunking,
+        "chunks": n_chunks,
+        "chunks_per_post": n_chunks / n_posts,
+        "build": {"seconds": build_s, "posts_per_s": n_posts / build_s, "chunks_per_s": n_chunks / build_s},
+        "rss_after_build_mb": peak_rss_mb(),
+        "backends": {},
+    }
+
+    for backend in backends:
+        cold = []
+        for query in questions[:COLD_QUERIES]:
+            start = time.perf_counter()
+            search_lib.search_top_k(COURSE, query, k=max(K_VALUES), backend=backend)
+            cold.append(time.perf_counter() - start)
+
+        start = time.perf_counter()
+        engine = search_lib.CourseEngine(COURSE, backend=backend)
+        load_s = time.perf_counter() - start
+        warm, stages, found = [], {"bm25": [], "embed": [], "vector": []}, {k: 0 for k in K_VALUES}
+        for round_no in range(WARM_ROUNDS):
+            for query, answers in zip(questions, relevant):
+                timings = {}
+                start = time.perf_counter()
+                top = engine.search(query, k=max(K_VALUES), timings=timings)
+                warm.append(time.perf_counter() - start)
+                for stage, seconds in timings.items():
+                    stages[stage].append(seconds)
+                if round_no == 0:
+                    ids = [r["post_id"] for r in top]
+                    for k in K_VALUES:
+                        found[k] += len(set(ids[:k]) & set(answers))
+
+        result["backends"][backend] = {
+            "load_s": load_s,
+            "cold_ms": percentiles(cold),
+            "warm_ms": percentiles(warm),
+            "stages_ms": {stage: percentiles(samples) for stage, samples in stages.items()},
+            "recall": {f"@{k}": found[k] / (len(questions) * RELEVANT_PER_QUESTION) for k in K_VALUES},
+            "engine_mb": engine.nbytes / 2**20,
+            "peak_rss_mb": peak_rss_mb(),
+        }
+    return result
+
+
+def git_commit() -> str:
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=BACKEND_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(results: list):
+    print(f"{'posts':>7} {'chunking':>12} {'chunks':>8} {'build s':>8} {'posts/s':>8} {'chunks/s':>9} | "
+          f"{'backend':>7} {'cold p50':>9} {'warm p50':>9} {'p95':>7} {'p99':>7} "
+          f"{'bm25':>6} {'embed':>6} {'vector':>7} {'R@3':>5} {'R@10':>5} {'peak MB':>8}")
+    for r in results:
+        for name, b in r["backends"].items():
+            st = b["stages_ms"]
+            print(f"{r['posts']:>7} {r['chunking']:>12} {r['chunks']:>8} {r['build']['seconds']:>8.1f} "
+                  f"{r['build']['posts_per_s']:>8.0f} {r['build']['chunks_per_s']:>9.0f} | "
+                  f"{name:>7} {b['cold_ms']['p50']:>9.1f} {b['warm_ms']['p50']:>9.2f} "
+                  f"{b['warm_ms']['p95']:>7.2f} {b['warm_ms']['p99']:>7.2f} "
+                  f"{st['bm25']['mean']:>6.2f} {st['embed']['mean']:>6.2f} {st['vector']['mean']:>7.2f} "
+                  f"{b['recall']['@3']:>5.2f} {b['recall']['@10']:>5.2f} {b['peak_rss_mb']:>8.0f}")
+    print("latencies in ms; stage columns are warm means")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Offline search benchmark on synthetic courses.")
+    parser.add_argument("--sizes", default=",".join(map(str, SIZES)), help="comma-separated corpus sizes")
+    parser.add_argument("--backends", default=",".join(BACKENDS), help="comma-separated vector backends")
+    parser.add_argument("--chunking", default=",".join(CHUNKING), help="comma-separated chunking specs")
+    parser.add_argument("--dim", type=int, default=DIM, help="fake embedding width")
+    parser.add_argument("--out", help="write results as json to this file")
+    parser.add_argument("--child", type=int, help=argparse.SUPPRESS)
+    parser.add_argument("--child-out", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    backends = args.backends.split(",")
+
+    if args.child:
+        work = Path(tempfile.mkdtemp(prefix="search_bench_"))
+        try:
+            result = run_size(work, args.child, backends, args.dim, args.chunking)
+        finally:
+            os.chdir(tempfile.gettempdir())
+            shutil.rmtree(work, ignore_errors=True)
+        Path(args.child_out).write_text(json.dumps(result))
+        return
+
+    # one process per size and strategy, so peak memory is per corpus
+    results = []
+    for size in map(int, args.sizes.split(",")):
+        for chunking in args.chunking.split(","):
+            print(f"benchmarking {size} posts, {chunking} chunking...", flush=True)
+            with tempfile.NamedTemporaryFile(suffix=".json", delete=False) as f:
+                child_out = f.name
+            subprocess.run([sys.executable, str(Path(__file__).resolve()), "--child", str(size),
+                            "--backends", args.backends, "--chunking", chunking, "--dim", str(args.dim),
+                            "--child-out", child_out], check=True)
+            results.append(json.loads(Path(child_out).read_text()))
+            os.unlink(child_out)
+
+    report = {
+        "commit": git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "machine": {"cpus": os.cpu_count()},
+        "config": {"dim": args.dim, "seed": SEED, "relevant_per_question": RELEVANT_PER_QUESTION,
+                   "near_misses_per_question": NEAR_MISSES_PER_QUESTION, "warm_rounds": WARM_ROUNDS,
+                   "cold_queries": COLD_QUERIES},
+        "results": results,
+    }
+    print_report(results)
+    if args.out:
+        Path(args.out).write_text(json.dumps(report, indent=2))
+        print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
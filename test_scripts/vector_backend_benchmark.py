@@ -0,0 +1,161 @@
+import sys
+import json
+import time
+import shutil
+import tempfile
+from pathlib import Path
+
+import numpy as np
+
+# run from anywhere: import the backend modules directly
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "backend"))
+from vector_index import ChromaVectorIndex, NumpyVectorIndex, INDEX_CONFIG_FILE, truncate_vectors
+
+# Compares the Chroma (HNSW) and exact numpy vector backends: per-query
+# latency of the semantic stage (100 nearest chunks, reduced to posts) and
+# how many of the exact top posts each backend finds. Also covers compressed
+# indexes against the uncompressed one: the int8 and binary numpy matrices
+# (rescored from a memory-mapped copy of the full vectors, like the embedding
+# store) and Matryoshka truncation to each of DIMS, searched at that width
+# and rescored at full length, with the Chroma folder size a course indexed
+# at that dimension would have.
+#
+#   python vector_backend_benchmark.py             synthetic course
+#   python vector_backend_benchmark.py <data/<nid>/db>   a built course (run from backend/)
+#
+# Queries are stored chunk vectors plus noise, so no embeddings API calls are made.
+# Synthetic vectors are not Matryoshka-trained, so they lose more recall when
+# truncated than real text-embedding-3 vectors do; use a built course for dims.
+
+N_QUERIES = 200
+N_CHUNKS = 20_000  # synthetic course: chunks
+CHUNKS_PER_POST = 8
+DIM = 3072  # text-embedding-3-large
+TOP_N = 100
+TOP_K = 10
+DIMS = [1024, 256]  # truncated widths to compare
+
+rng = np.random.default_rng(0)
+
+
+def synthetic_course(persist_dir: Path):
+    """Clustered unit vectors: each post's chunks lie near a post centre."""
+    n_posts = N_CHUNKS // CHUNKS_PER_POST
+    centres = rng.standard_normal((n_posts, DIM), dtype=np.float32)
+    post_of = rng.integers(0, n_posts, N_CHUNKS)
+    vectors = centres[post_of] + 0.8 * rng.standard_normal((N_CHUNKS, DIM), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    collection = ChromaVectorIndex(persist_dir, None).db._collection
+    for lo in range(0, N_CHUNKS, 1000):
+        ids = range(lo, min(lo + 1000, N_CHUNKS))
+        collection.add(ids=[str(i) for i in ids], embeddings=vectors[lo:lo + 1000],
+                       metadatas=[{"post_id": str(post_of[i]), "subject": f"post {post_of[i]}", "idx": i} for i in ids],
+                       documents=["" for _ in ids])
+
+
+def timed(index, queries):
+    latencies, results = [], []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(index.search([q], n=TOP_N)[0])
+        latencies.append(time.perf_counter() - start)
+    latencies.sort()
+    pick = lambda p: latencies[min(len(latencies) - 1, int(p * len(latencies)))] * 1000
+    return results, pick(0.5), pick(0.95)
+
+
+def dir_mb(path: Path) -> float:
+    return sum(f.stat().st_size for f in path.rglob("*") if f.is_file()) / 2**20
+
+
+def truncated_course(persist_dir: Path, index: NumpyVectorIndex, dim: int):
+    """A Chroma folder holding index's vectors cut to dim, as build_db writes them for vector_dim."""
+    vectors = truncate_vectors(index.matrix.astype(np.float32), dim)
+    collection = ChromaVectorIndex(persist_dir, None).db._collection
+    for lo in range(0, len(vectors), 1000):
+        ids = range(lo, min(lo + 1000, len(vectors)))
+        collection.add(ids=[str(i) for i in ids], embeddings=vectors[lo:lo + 1000].tolist(),
+                       metadatas=[{"post_id": index.post_ids[index.post_of[i]], "subject": "", "idx": i}
+                                  for i in ids],
+                       documents=["" for _ in ids])
+    (persist_dir / INDEX_CONFIG_FILE).write_text(json.dumps({"chunking": "sentences", "vector_dim": dim}))
+    return vectors
+
+
+def recall(results, exact, k=None):
+    found = total = 0
+    for got, truth in zip(results, exact):
+        truth = {p["post_id"] for p in truth[:k]}
+        found += len(truth & {p["post_id"] for p in got[:k]})
+        total += len(truth)
+    return found / total if total else 1.0
+
+
+def main():
+    scratch = Path(tempfile.mkdtemp())
+    if len(sys.argv) > 1:
+        persist_dir = Path(sys.argv[1])
+    else:
+        persist_dir = scratch / "db"
+        print(f"building a synthetic course: {N_CHUNKS} chunks of dim {DIM}...")
+        synthetic_course(persist_dir)
+
+    start = time.perf_counter()
+    chroma = ChromaVectorIndex(persist_dir, None)
+    t_chroma = time.perf_counter() - start
+    start = time.perf_counter()
+    exact = NumpyVectorIndex(persist_dir, None, dtype="float32")
+    t_numpy = time.perf_counter() - start
+    chunk_posts = [exact.post_ids[c] for c in exact.post_of]
+    chunk_subjects = [exact.subjects[c] for c in exact.post_of]
+    half = NumpyVectorIndex.from_arrays(exact.matrix, chunk_posts, chunk_subjects, dtype="float16")
+    # the full vectors on disk, memory-mapped, as quantized indexes read them from the embedding store
+    np.save(scratch / "full.npy", exact.matrix)
+    full = np.load(scratch / "full.npy", mmap_mode="r")
+    compressed = [(f"numpy {dtype}", NumpyVectorIndex.from_arrays(exact.matrix, chunk_posts, chunk_subjects,
+                                                                  dtype=dtype, full=full))
+                  for dtype in ("int8", "binary")]
+
+    # a stored chunk moved by noise about a third of its length
+    rows = rng.integers(0, len(exact.matrix), N_QUERIES)
+    dim = exact.matrix.shape[1]
+    queries = exact.matrix[rows] + 0.3 / np.sqrt(dim) * rng.standard_normal((N_QUERIES, dim), dtype=np.float32)
+    queries = [q.tolist() for q in queries]
+
+    print(f"{len(exact.matrix)} chunks, {len(exact.post_ids)} posts, {N_QUERIES} queries; "
+          f"open chroma {t_chroma:.2f}s, load numpy {t_numpy:.2f}s")
+    truth, _, _ = timed(exact, queries)
+    print(f"{'backend':>20} {'p50 ms':>8} {'p95 ms':>8} {'recall@posts':>13} {f'recall@{TOP_K}':>10} "
+          f"{'memory':>9} {'db disk':>9}")
+
+    def report(name, index, queries, disk=None):
+        results, p50, p95 = timed(index, queries)
+        memory = f"{index.nbytes / 2**20:.0f}MB" if index.nbytes else "-"
+        disk = f"{disk:.0f}MB" if disk is not None else ""
+        print(f"{name:>20} {p50:>8.2f} {p95:>8.2f} {recall(results, truth):>13.3f} "
+              f"{recall(results, truth, TOP_K):>10.3f} {memory:>9} {disk:>9}")
+
+    full_disk = dir_mb(persist_dir)
+    report("chroma", chroma, queries, full_disk)
+    report("numpy float32", exact, queries, full_disk)
+    report("numpy float16", half, queries)
+    for name, index in compressed:
+        report(name, index, queries)
+
+    # Matryoshka truncation: shorter vectors in chroma and memory, searched with the query cut to
+    # match; the top chunks are rescored at full length from the memory-mapped full vectors
+    for d in (d for d in DIMS if d < dim):
+        vectors = truncated_course(scratch / f"db{d}", exact, d)
+        disk = dir_mb(scratch / f"db{d}")
+        short = ChromaVectorIndex(scratch / f"db{d}", None)
+        short.full, short.full_rows = full, {str(i): i for i in range(len(vectors))}  # ids are full's rows
+        report(f"chroma dim {d}", short, queries, disk)
+        for dtype in ("float32", "int8"):
+            index = NumpyVectorIndex.from_arrays(vectors, chunk_posts, chunk_subjects, dtype=dtype, full=full)
+            report(f"numpy {dtype} dim {d}", index, queries, disk)
+
+    shutil.rmtree(scratch, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()